@@ -0,0 +1,103 @@
+"""Shared helpers for benchmarks that drive server.app in-process."""
+import os
+import uuid
+from collections import Counter
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+import server
+
+# Driver housekeeping that is not part of a request's own work
+IGNORED_COMMANDS = {"endSessions", "hello", "isMaster", "ismaster", "ping"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts Mongo round trips issued through the benchmark client."""
+
+    def __init__(self):
+        self.count = 0
+        self.by_command = Counter()
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.count += 1
+            self.by_command[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, round_trips=None) -> dict:
+    summary = {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    if round_trips:
+        summary["round_trips"] = round(sum(round_trips) / len(round_trips), 2)
+    return summary
+
+
+async def use_benchmark_database(name: str) -> CommandCounter:
+    """Point server at a fresh, instrumented database derived from DB_NAME."""
+    counter = CommandCounter()
+    server.client = AsyncIOMotorClient(os.environ["MONGO_URL"], event_listeners=[counter])
+    server.db = server.client[f"{os.environ['DB_NAME']}_{name}"]
+    server._image_store = None
+    server._response_cache = None
+    server._job_queue = None
+    server.user_cache.clear()
+    server.token_cache.clear()
+    await server.client.drop_database(server.db.name)
+    await server.ensure_indexes()
+    return counter
+
+
+def app_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app), base_url="http://benchmark/api", timeout=None
+    )
+
+
+async def register(client: httpx.AsyncClient, role: str, region: str = "accra") -> dict:
+    tag = uuid.uuid4().hex[:12]
+    response = await client.post("/auth/register", json={
+        "email": f"{role}-{tag}@bench.test",
+        "password": "Password123!",
+        "name": f"Bench {role} {tag}",
+        "role": role,
+        "phone": "+233200000000",
+        "region": region,
+    })
+    response.raise_for_status()
+    data = response.json()
+    return {
+        "id": data["user"]["id"],
+        "email": data["user"]["email"],
+        "headers": {"Authorization": f"Bearer {data['access_token']}"},
+    }
+
+
+def produce_payload(index: int, quantity: int = 1_000_000) -> dict:
+    return {
+        "title": f"Bench produce {index}",
+        "category": "grains",
+        "description": "Benchmark listing",
+        "price": 12.5,
+        "quantity": quantity,
+        "unit": "kg",
+    }
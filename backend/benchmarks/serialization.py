@@ -0,0 +1,144 @@
+"""Per-item serialization cost of the list endpoints, before and after the fast path.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization [--items 1000] [--repeat 20] [--json]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from server import (
+    Order, Produce, OrderStatus, ProduceCategory, Region,
+    ORDER_DEFAULTS, PRODUCE_DEFAULTS, trusted_documents
+)
+
+
+def make_produce_docs(count: int) -> List[dict]:
+    now = datetime.utcnow().replace(microsecond=0)
+    categories = list(ProduceCategory)
+    regions = list(Region)
+    return [{
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "farmer_id": str(uuid.uuid4()),
+        "farmer_name": f"Farmer {i}",
+        "title": f"Fresh produce lot {i}",
+        "category": categories[i % len(categories)].value,
+        "description": "Harvested this week, graded and bagged at the farm gate.",
+        "price": 10.0 + i % 50,
+        "quantity": 100 + i,
+        "unit": "kg",
+        "region": regions[i % len(regions)].value,
+        "image_id": uuid.uuid4().hex * 2 if i % 2 else None,
+        "unique_code": uuid.uuid4().hex[:8].upper(),
+        "created_at": now - timedelta(minutes=i),
+        "is_available": True,
+    } for i in range(count)]
+
+
+def make_order_docs(count: int) -> List[dict]:
+    now = datetime.utcnow().replace(microsecond=0)
+    statuses = list(OrderStatus)
+    return [{
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "produce_id": str(uuid.uuid4()),
+        "farmer_id": str(uuid.uuid4()),
+        "buyer_id": str(uuid.uuid4()),
+        "buyer_name": f"Buyer {i}",
+        "farmer_name": f"Farmer {i}",
+        "produce_title": f"Fresh produce lot {i}",
+        "quantity": 1 + i % 20,
+        "unit_price": 12.5,
+        "total_amount": 12.5 * (1 + i % 20),
+        "status": statuses[i % len(statuses)].value,
+        "payment_reference": None,
+        "created_at": now - timedelta(minutes=i),
+        "updated_at": now - timedelta(minutes=i),
+    } for i in range(count)]
+
+
+def strip_id(docs: List[dict]) -> List[dict]:
+    # What the projected query hands back
+    return [{key: value for key, value in doc.items() if key != "_id"} for doc in docs]
+
+
+async def model_path(model, docs: List[dict]) -> bytes:
+    # Previous behaviour: build models, then FastAPI validates and encodes them again
+    field = create_response_field(name="response", type_=List[model])
+    content = await serialize_response(field=field, response_content=[model(**doc) for doc in docs])
+    return JSONResponse(content).body
+
+
+async def fast_path(docs: List[dict], defaults: dict) -> bytes:
+    return ORJSONResponse(trusted_documents(docs, defaults)).body
+
+
+async def measure(serialize, load_docs, repeat: int) -> float:
+    """Median wall time of one serialization; loading the documents is not timed."""
+    timings = []
+    for _ in range(repeat):
+        docs = load_docs()
+        start = time.perf_counter()
+        await serialize(docs)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+async def run(items: int, repeat: int) -> dict:
+    produce_docs = make_produce_docs(items)
+    order_docs = make_order_docs(items)
+    cases = {
+        "produce": (
+            (lambda docs: model_path(Produce, docs), lambda: produce_docs),
+            (lambda docs: fast_path(docs, PRODUCE_DEFAULTS), lambda: strip_id(produce_docs)),
+        ),
+        "orders": (
+            (lambda docs: model_path(Order, docs), lambda: order_docs),
+            (lambda docs: fast_path(docs, ORDER_DEFAULTS), lambda: strip_id(order_docs)),
+        ),
+    }
+
+    results = {}
+    for name, (before, after) in cases.items():
+        before_s = await measure(*before, repeat)
+        after_s = await measure(*after, repeat)
+        results[name] = {
+            "items": items,
+            "before_us_per_item": round(before_s / items * 1e6, 3),
+            "after_us_per_item": round(after_s / items * 1e6, 3),
+            "speedup": round(before_s / after_s, 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.items, args.repeat))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'list':<10}{'before µs/item':>16}{'after µs/item':>16}{'speedup':>10}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['before_us_per_item']:>16}{result['after_us_per_item']:>16}"
+              f"{result['speedup']:>9}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Throughput and latency of the main API routes against a seeded database.
+
+Seeds users, listings (half with images) and orders at the volumes below times
+--scale, then drives each scenario through server.app in-process with
+httpx's ASGI transport. Run from the backend directory:
+
+    python -m benchmarks.suite --engine mongo --scale 0.01 --output results.json
+    python -m benchmarks.suite --compare before.json after.json
+
+--engine mongo uses the MongoDB from backend/.env (database <DB_NAME>_bench_suite,
+dropped first); --engine memory uses the in-process engine from memory_engine.py.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from PIL import Image
+
+import server
+from memory_engine import MemoryClient
+from benchmarks.common import app_client, summarize, use_benchmark_database
+
+VOLUMES = {"users": 10_000, "produce": 100_000, "orders": 1_000_000}
+SEED_BATCH = 10_000
+PASSWORD = "Password123!"
+CROPS = ["maize", "yam", "cassava", "plantain", "tomato", "pepper", "okra", "mango",
+         "pineapple", "goat", "chicken", "rice", "cocoa", "groundnut", "onion"]
+SCENARIOS = ["register", "login", "catalog_search", "order_placement", "order_list", "dashboard_stats"]
+
+
+async def use_memory_engine():
+    server.client = MemoryClient()
+    server.db = server.client["bench_suite"]
+    server.STORAGE_ENGINE = "memory"
+    # GridFS needs a real server, so images go to a throwaway directory
+    server.IMAGE_STORE_PATH = Path(tempfile.mkdtemp(prefix="bench-images-"))
+    server._image_store = None
+    server._response_cache = None
+    server._job_queue = None
+    server.user_cache.clear()
+    server.token_cache.clear()
+    await server.ensure_indexes()
+
+
+async def seed_images(count: int) -> list:
+    image_ids = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), (i * 37 % 256, 140, 60)).save(buffer, format="JPEG")
+        image_ids.append(await server.store_image(buffer.getvalue()))
+    return image_ids
+
+
+async def insert_batched(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == SEED_BATCH:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def seed(scale: float, rng: random.Random) -> dict:
+    counts = {name: max(1, int(volume * scale)) for name, volume in VOLUMES.items()}
+    now = datetime.utcnow()
+    password_hash = await server.hash_password(PASSWORD)
+    stats = Counter()
+
+    users = []
+    for i in range(counts["users"]):
+        role = server.UserRole.FARMER if i % 3 == 0 else server.UserRole.BUYER
+        users.append(server.User(
+            email=f"seed{i}@bench.test", password=password_hash, name=f"Seed user {i}", role=role,
+            phone="+233200000000", region=rng.choice(list(server.Region)),
+            created_at=now - timedelta(days=rng.randint(0, 365))
+        ).dict())
+    await insert_batched(server.db.users, users)
+    farmers = [user for user in users if user["role"] == server.UserRole.FARMER]
+    buyers = [user for user in users if user["role"] == server.UserRole.BUYER]
+
+    image_ids = await seed_images(min(20, counts["produce"]))
+    produce = []
+    for i in range(counts["produce"]):
+        farmer = rng.choice(farmers)
+        crop = rng.choice(CROPS)
+        listing = server.Produce(
+            farmer_id=farmer["id"], farmer_name=farmer["name"], title=f"{crop.title()} lot {i}",
+            category=rng.choice(list(server.ProduceCategory)),
+            description=f"Fresh {crop} from the {farmer['region'].value} region",
+            price=round(rng.uniform(2, 500), 2), quantity=rng.randint(1_000, 100_000), unit="kg",
+            region=farmer["region"], image_id=image_ids[i % len(image_ids)] if i % 2 else None,
+            created_at=now - timedelta(minutes=rng.randint(0, 525_600))
+        ).dict()
+        produce.append(listing)
+        stats[(farmer["id"], "total_produce")] += 1
+        stats[(farmer["id"], "active_produce")] += 1
+    await insert_batched(server.db.produce, produce)
+
+    def orders():
+        statuses = list(server.OrderStatus)
+        for _ in range(counts["orders"]):
+            listing = rng.choice(produce)
+            buyer = rng.choice(buyers)
+            quantity = rng.randint(1, 20)
+            order_status = rng.choice(statuses)
+            for user_id in (listing["farmer_id"], buyer["id"]):
+                stats[(user_id, "total_orders")] += 1
+                stats[(user_id, "pending_orders")] += order_status == server.OrderStatus.PENDING
+                stats[(user_id, "completed_orders")] += order_status == server.OrderStatus.DELIVERED
+            created_at = now - timedelta(minutes=rng.randint(0, 525_600))
+            yield server.Order(
+                produce_id=listing["id"], farmer_id=listing["farmer_id"], buyer_id=buyer["id"],
+                buyer_name=buyer["name"], farmer_name=listing["farmer_name"], produce_title=listing["title"],
+                quantity=quantity, unit_price=listing["price"], total_amount=quantity * listing["price"],
+                status=order_status, created_at=created_at, updated_at=created_at
+            ).dict()
+    await insert_batched(server.db.orders, orders())
+
+    await insert_batched(server.db.user_stats, ({
+        "user_id": user["id"],
+        **{field: stats[(user["id"], field)] for field in server.STAT_FIELDS},
+        "reconciled_at": now,
+    } for user in users))
+
+    return {"counts": counts, "farmers": farmers, "buyers": buyers, "produce_ids": [p["id"] for p in produce]}
+
+
+def bearer(user: dict) -> dict:
+    token = server.create_access_token({"sub": user["id"]}, timedelta(hours=12))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def scenario_requests(name: str, seeded: dict, rng: random.Random):
+    """Return a factory producing one request coroutine per call."""
+    farmers, buyers, produce_ids = seeded["farmers"], seeded["buyers"], seeded["produce_ids"]
+    buyer_headers = [bearer(user) for user in rng.sample(buyers, min(200, len(buyers)))]
+    all_headers = buyer_headers + [bearer(user) for user in rng.sample(farmers, min(100, len(farmers)))]
+
+    def factory(client):
+        if name == "register":
+            return client.post("/auth/register", json={
+                "email": f"bench-{uuid.uuid4().hex}@bench.test", "password": PASSWORD, "name": "Bench",
+                "role": "buyer", "phone": "+233200000000", "region": "accra",
+            })
+        if name == "login":
+            user = rng.choice(buyers)
+            return client.post("/auth/login", json={"email": user["email"], "password": PASSWORD})
+        if name == "catalog_search":
+            params = {"limit": 50}
+            if rng.random() < 0.5:
+                params["category"] = rng.choice(list(server.ProduceCategory)).value
+            if rng.random() < 0.5:
+                params["region"] = rng.choice(list(server.Region)).value
+            if rng.random() < 0.5:
+                params["search"] = rng.choice(CROPS)
+            return client.get("/produce", params=params)
+        if name == "order_placement":
+            return client.post(
+                "/orders", json={"produce_id": rng.choice(produce_ids), "quantity": 1},
+                headers=rng.choice(buyer_headers)
+            )
+        if name == "order_list":
+            return client.get("/orders", headers=rng.choice(all_headers))
+        if name == "dashboard_stats":
+            return client.get("/dashboard/stats", headers=rng.choice(all_headers))
+        raise ValueError(f"Unknown scenario {name}")
+
+    return factory
+
+
+async def drive(client, factory, requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await factory(client)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        **summarize(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    if not args.response_cache:
+        server.RESPONSE_CACHE_BACKEND = "off"
+    if args.engine == "memory":
+        await use_memory_engine()
+    else:
+        await use_benchmark_database("bench_suite")
+
+    rng = random.Random(args.seed)
+    seed_started = time.perf_counter()
+    seeded = await seed(args.scale, rng)
+    seed_seconds = time.perf_counter() - seed_started
+
+    results = {}
+    async with app_client() as client:
+        for name in args.scenarios:
+            factory = scenario_requests(name, seeded, rng)
+            results[name] = await drive(client, factory, args.requests, args.concurrency)
+
+    return {
+        "meta": {
+            "commit": current_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "engine": args.engine,
+            "scale": args.scale,
+            "seeded": seeded["counts"],
+            "seed_seconds": round(seed_seconds, 1),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "response_cache": args.response_cache,
+            "bcrypt_rounds": server.BCRYPT_ROUNDS,
+        },
+        "results": results,
+    }
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    print(f"{'scenario':<18}{'rps':>22}{'p50 ms':>22}{'p99 ms':>22}")
+    for name, result in after["results"].items():
+        old = before["results"].get(name)
+        if old is None:
+            continue
+        cells = []
+        for metric in ("throughput_rps", "p50_ms", "p99_ms"):
+            change = (result[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            cells.append(f"{old[metric]:>8} -> {result[metric]:<8}{change:+.0f}%")
+        print(f"{name:<18}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded in-process API benchmark suite")
+    parser.add_argument("--engine", choices=["mongo", "memory"], default="mongo")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the seeded volumes")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--response-cache", action="store_true", help="Keep the catalog response cache on")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Throughput of serve.py as the number of worker processes grows.
+
+Needs the MongoDB from backend/.env. Seeds <DB_NAME>_bench_workers once, then for
+each --workers count starts serve.py against it, waits for /api/health/ready and
+drives each scenario over real HTTP from --clients load-generator processes, so
+the client side is not the bottleneck. Run from the backend directory:
+
+    python -m benchmarks.workers --workers 1 2 4 8 --duration 20 [--json]
+
+The catalog response cache is off, so catalog reads reach MongoDB every time.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import httpx
+
+import server
+from benchmarks.common import app_client, produce_payload, register, summarize, use_benchmark_database
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATABASE = "bench_workers"
+PASSWORD = "Password123!"
+SCENARIOS = ["catalog", "produce_detail", "login"]
+
+
+async def seed(listings: int) -> dict:
+    await use_benchmark_database(DATABASE)
+    async with app_client() as client:
+        farmer = await register(client, "farmer")
+        buyer = await register(client, "buyer")
+        produce_ids = []
+        for i in range(listings):
+            response = await client.post("/produce", json=produce_payload(i), headers=farmer["headers"])
+            produce_ids.append(response.json()["id"])
+    server.client.close()
+    return {"buyer_email": buyer["email"], "produce_ids": produce_ids}
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DB_NAME": f"{os.environ['DB_NAME']}_{DATABASE}",
+        "RESPONSE_CACHE_BACKEND": "off",
+        "ENSURE_INDEXES": "false",
+    }
+    return subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--no-access-log",
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+def wait_until_ready(base_url: str, workers: int, timeout: float = 60.0):
+    # Every worker has to answer before the run starts, not just the first one up
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while time.monotonic() < deadline:
+        try:
+            ready = ready + 1 if httpx.get(f"{base_url}/health/ready", timeout=2).status_code == 200 else 0
+        except httpx.HTTPError:
+            ready = 0
+        if ready >= workers * 4:
+            return
+        time.sleep(0.05 if ready else 0.5)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+
+def request_for(name: str, seeded: dict, rng: random.Random):
+    if name == "catalog":
+        params = {"limit": 50}
+        if rng.random() < 0.5:
+            params["category"] = "grains"
+        return "GET", "/produce", {"params": params}
+    if name == "produce_detail":
+        return "GET", f"/produce/{rng.choice(seeded['produce_ids'])}", {}
+    if name == "login":
+        return "POST", "/auth/login", {"json": {"email": seeded["buyer_email"], "password": PASSWORD}}
+    raise ValueError(f"Unknown scenario {name}")
+
+
+def load_process(base_url: str, name: str, seeded: dict, concurrency: int, duration: float, seed: int) -> tuple:
+    """One load generator: concurrency connections issuing requests back to back for duration."""
+    async def run():
+        rng = random.Random(seed)
+        latencies, errors = [], 0
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            deadline = time.perf_counter() + duration
+
+            async def worker():
+                nonlocal errors
+                while time.perf_counter() < deadline:
+                    method, path, kwargs = request_for(name, seeded, rng)
+                    start = time.perf_counter()
+                    try:
+                        response = await client.request(method, path, **kwargs)
+                        errors += response.status_code >= 400
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors
+    return asyncio.run(run())
+
+
+def measure(base_url: str, name: str, seeded: dict, args) -> dict:
+    per_client = max(1, args.concurrency // args.clients)
+    with ProcessPoolExecutor(max_workers=args.clients) as pool:
+        futures = [
+            pool.submit(load_process, base_url, name, seeded, per_client, args.duration, args.seed + i)
+            for i in range(args.clients)
+        ]
+        results = [future.result() for future in futures]
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    errors = sum(client_errors for _, client_errors in results)
+    return {
+        **summarize(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / args.duration, 1),
+    }
+
+
+def run(args) -> dict:
+    seeded = asyncio.run(seed(args.listings))
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    results = {}
+    for workers in args.workers:
+        process = start_server(workers, args.port)
+        try:
+            wait_until_ready(base_url, workers)
+            results[workers] = {name: measure(base_url, name, seeded, args) for name in args.scenarios}
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    # Scaling efficiency: throughput per worker relative to the smallest run
+    baseline_workers = args.workers[0]
+    for workers, scenarios in results.items():
+        for name, result in scenarios.items():
+            baseline = results[baseline_workers][name]["throughput_rps"]
+            ideal = baseline * workers / baseline_workers
+            result["scaling_efficiency"] = round(result["throughput_rps"] / ideal, 2) if ideal else 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput scaling across worker processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per scenario and worker count")
+    parser.add_argument("--concurrency", type=int, default=64, help="Open connections across all clients")
+    parser.add_argument("--clients", type=int, default=4, help="Load-generator processes")
+    parser.add_argument("--listings", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    # server.py configures INFO logging on import; one line per request would swamp the output
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'workers':<9}{'scenario':<16}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'scaling':>9}")
+    for workers, scenarios in results.items():
+        for name, result in scenarios.items():
+            print(f"{workers:<9}{name:<16}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+                  f"{result['p99_ms']:>10}{result['errors']:>8}{result['scaling_efficiency']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Round trips and latency of every mutating route.
+
+Needs the MongoDB from backend/.env (a separate <DB_NAME>_bench_writes database
+is created and dropped). Run from the backend directory:
+
+    python -m benchmarks.writes [--iterations 200] [--json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+import uuid
+from collections import defaultdict
+
+from PIL import Image
+
+from benchmarks.common import (
+    app_client, produce_payload, register, summarize, use_benchmark_database
+)
+
+
+def sample_png(seed: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (seed % 256, 120, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def import_csv(rows: int) -> str:
+    lines = ["title,category,description,price,quantity,unit"]
+    lines += [f"Imported {i},vegetables,Bulk row,3.5,100,kg" for i in range(rows)]
+    return "\n".join(lines) + "\n"
+
+
+async def run(iterations: int) -> dict:
+    counter = await use_benchmark_database("bench_writes")
+    latencies = defaultdict(list)
+    round_trips = defaultdict(list)
+
+    async with app_client() as client:
+        async def timed(route: str, request):
+            before = counter.count
+            start = time.perf_counter()
+            response = await request
+            latencies[route].append(time.perf_counter() - start)
+            round_trips[route].append(counter.count - before)
+            response.raise_for_status()
+            return response.json()
+
+        farmer = await register(client, "farmer")
+        buyer = await register(client, "buyer")
+        listings = [
+            (await client.post("/produce", json=produce_payload(i), headers=farmer["headers"])).json()["id"]
+            for i in range(5)
+        ]
+
+        for i in range(iterations):
+            await timed("register", client.post("/auth/register", json={
+                "email": f"writer-{uuid.uuid4().hex}@bench.test", "password": "Password123!",
+                "name": "Writer", "role": "buyer", "phone": "+233200000000", "region": "accra",
+            }))
+            await timed("login", client.post(
+                "/auth/login", json={"email": buyer["email"], "password": "Password123!"}
+            ))
+            produce = await timed("create_produce", client.post(
+                "/produce", json=produce_payload(i), headers=farmer["headers"]
+            ))
+            await timed("update_produce", client.put(
+                f"/produce/{produce['id']}", json={**produce_payload(i), "price": 13.0}, headers=farmer["headers"]
+            ))
+            order = await timed("create_order", client.post(
+                "/orders", json={"produce_id": listings[i % len(listings)], "quantity": 1}, headers=buyer["headers"]
+            ))
+            await timed("update_order_status", client.put(
+                f"/orders/{order['id']}/status", params={"status": "confirmed"}, headers=farmer["headers"]
+            ))
+            await timed("checkout", client.post("/orders/checkout", json={
+                "items": [{"produce_id": produce_id, "quantity": 1} for produce_id in listings[:3]]
+            }, headers=buyer["headers"]))
+            if i % 10 == 0:
+                await timed("upload_image", client.post(
+                    "/images", files={"file": ("bench.png", sample_png(i), "image/png")}, headers=farmer["headers"]
+                ))
+                await timed("import_produce", client.post(
+                    "/produce/import", files={"file": ("bench.csv", import_csv(100), "text/csv")},
+                    headers=farmer["headers"]
+                ))
+
+    return {route: summarize(latencies[route], round_trips[route]) for route in latencies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the mutating API routes")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'route':<22}{'requests':>10}{'round trips':>13}{'p50 ms':>10}{'p99 ms':>10}")
+    for route, result in results.items():
+        print(f"{route:<22}{result['requests']:>10}{result['round_trips']:>13}"
+              f"{result['p50_ms']:>10}{result['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Developer diagnostics: opt-in per-request profiling and the Mongo slow-query log.
+
+DiagnosticsMiddleware records the ASGI scope of the current request in a context
+variable, which Motor carries into its executor threads, so the driver listener
+can attribute each command to the route that issued it ("get_all_produce").
+Commands slower than the threshold are queued here; server.py drains the queue,
+runs explain() once per query shape and keeps the results grouped by route.
+
+A request carrying the profiling token in the X-Profile header is run under
+pyinstrument and the HTML report is written to the profile directory; the
+response names it in X-Profile-Id. The token is only read from the header, so
+it never lands in access logs with the URL.
+"""
+import contextvars
+import hmac
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Optional
+
+from pymongo import monitoring
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # profiling is optional; the slow-query log does not need it
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+# Commands that are not query work, plus the explains the slow-query log issues itself
+IGNORED_COMMANDS = {"endSessions", "hello", "isMaster", "ismaster", "ping", "saslStart",
+                    "saslContinue", "explain", "getMore", "killCursors"}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Fields the driver adds that explain() rejects or that do not affect the plan
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "writeConcern",
+                 "readConcern", "cursor", "maxTimeMS", "comment"}
+
+
+def current_route() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return "background"
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", None) or scope.get("path", "unmatched")
+
+
+def query_shape(value):
+    """The filter with every value replaced by "?", so equal shapes group together."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]
+    return "?"
+
+
+def command_shape(command_name: str, command: dict):
+    if command_name == "find":
+        return query_shape(command.get("filter", {}))
+    if command_name in ("count", "distinct", "findAndModify"):
+        return query_shape(command.get("query", {}))
+    if command_name == "update":
+        return query_shape(command["updates"][0].get("q", {})) if command.get("updates") else None
+    if command_name == "delete":
+        return query_shape(command["deletes"][0].get("q", {})) if command.get("deletes") else None
+    if command_name == "aggregate":
+        return [
+            {"$match": query_shape(stage["$match"])} if "$match" in stage else next(iter(stage))
+            for stage in command.get("pipeline", [])
+        ]
+    return None
+
+
+def explain_command(command_name: str, command: dict) -> Optional[dict]:
+    if command_name not in EXPLAINABLE_COMMANDS:
+        return None
+    return {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Queues commands slower than threshold_ms together with the route that sent them."""
+
+    def __init__(self, threshold_ms: float, pending: deque):
+        self.threshold_micros = threshold_ms * 1000
+        self.pending = pending
+        self.started_commands = {}
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.started_commands[event.request_id] = (event.command, event.database_name, current_route())
+
+    def succeeded(self, event):
+        started = self.started_commands.pop(event.request_id, None)
+        if started is not None and event.duration_micros >= self.threshold_micros:
+            self._record(event, started)
+
+    def failed(self, event):
+        started = self.started_commands.pop(event.request_id, None)
+        if started is not None and event.duration_micros >= self.threshold_micros:
+            self._record(event, started)
+
+    def _record(self, event, started):
+        command, database_name, route = started
+        collection = command.get(event.command_name)
+        self.pending.append({
+            "route": route,
+            "database": database_name,
+            "collection": collection if isinstance(collection, str) else "-",
+            "command": event.command_name,
+            "duration_ms": event.duration_micros / 1000,
+            "shape": command_shape(event.command_name, command),
+            "explain": explain_command(event.command_name, command),
+        })
+
+
+class SlowQueryLog:
+    """Slow commands aggregated per (route, collection, command, shape)."""
+
+    def __init__(self, max_shapes: int = 500):
+        self.max_shapes = max_shapes
+        self.pending = deque(maxlen=10000)
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def key(entry: dict) -> tuple:
+        return (entry["route"], entry["collection"], entry["command"], repr(entry["shape"]))
+
+    def needs_plan(self, entry: dict) -> bool:
+        existing = self.entries.get(self.key(entry))
+        return entry["explain"] is not None and (existing is None or existing["plan"] is None)
+
+    def record(self, entry: dict, plan: Optional[dict] = None):
+        key = self.key(entry)
+        existing = self.entries.get(key)
+        if existing is None:
+            if len(self.entries) >= self.max_shapes:
+                self.entries.popitem(last=False)
+            existing = self.entries[key] = {
+                "collection": entry["collection"],
+                "command": entry["command"],
+                "shape": entry["shape"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "plan": None,
+            }
+        existing["count"] += 1
+        existing["total_ms"] += entry["duration_ms"]
+        existing["max_ms"] = max(existing["max_ms"], entry["duration_ms"])
+        existing["last_seen"] = time.time()
+        if plan is not None:
+            existing["plan"] = plan
+        logger.warning(
+            "Slow %s on %s from %s: %.1f ms, shape %s, plan %s",
+            entry["command"], entry["collection"], entry["route"], entry["duration_ms"],
+            entry["shape"], (existing["plan"] or {}).get("stages"),
+        )
+
+    def by_route(self) -> dict:
+        grouped = {}
+        for (route, *_), entry in self.entries.items():
+            grouped.setdefault(route, []).append({
+                **entry,
+                "total_ms": round(entry["total_ms"], 3),
+                "max_ms": round(entry["max_ms"], 3),
+            })
+        for entries in grouped.values():
+            entries.sort(key=lambda entry: entry["total_ms"], reverse=True)
+        return grouped
+
+    def clear(self):
+        self.entries.clear()
+
+
+class DiagnosticsMiddleware:
+    """Tracks the current request for the slow-query log and profiles requests that ask for it."""
+
+    def __init__(self, app, profiling_token: Optional[str] = None, profile_dir: Optional[Path] = None):
+        self.app = app
+        self.profiling_token = profiling_token
+        self.profile_dir = profile_dir
+
+    def wants_profile(self, scope) -> bool:
+        # The debug routes reuse the token header; fetching a report should not write another
+        if not self.profiling_token or scope["path"].startswith("/api/debug/"):
+            return False
+        supplied = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                supplied = value.decode("latin-1")
+        return supplied is not None and hmac.compare_digest(supplied, self.profiling_token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        try:
+            if self.wants_profile(scope):
+                await self.profile(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+    async def profile(self, scope, receive, send):
+        if Profiler is None:
+            logger.warning("Profiling requested but pyinstrument is not installed")
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = Profiler(interval=0.001, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            # Rendering and writing the report takes a while; keep it off the event loop
+            await run_in_threadpool(self.write_report, profiler, profile_id, scope)
+
+    def write_report(self, profiler, profile_id: str, scope):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        (self.profile_dir / f"{profile_id}.html").write_text(profiler.output_html())
+        logger.info("Profiled %s %s as %s\n%s", scope["method"], scope["path"], profile_id,
+                    profiler.output_text(unicode=False, color=False))
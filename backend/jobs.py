@@ -0,0 +1,279 @@
+"""Durable background jobs stored in a MongoDB collection.
+
+Request handlers enqueue work that does not have to finish before the response
+(thumbnails, notifications, audit entries) and return. A JobWorker
+claims due jobs with findOneAndUpdate, which hides a job from other workers for
+its type's visibility timeout; a worker that dies mid-job simply lets the lease
+expire and the job is claimed again. Failed jobs are retried with exponential
+backoff and jitter until max_attempts, then kept with status "failed".
+
+server.py registers the handlers on a JobRegistry and runs a worker in each API
+process (JOBS_MODE=in_process) or leaves them to `python -m worker`. Delivery is
+at least once, so handlers should be idempotent or tolerate a rare repeat.
+
+Job document: {type, payload, status: queued|running|done|failed, attempts,
+max_attempts, available_at, lease, created_at, finished_at, expires_at, last_error}.
+Finished jobs get expires_at = finished_at + retention for a TTL index to remove;
+on storage without TTL expiry, give the worker a purge_interval to delete them.
+"""
+import asyncio
+import logging
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobType:
+    """A handler plus its limits: concurrency is per worker process."""
+
+    def __init__(self, name: str, handler: Callable[[dict], Awaitable[None]], concurrency: int,
+                 max_attempts: int, visibility_timeout: float, retry_base_seconds: float,
+                 retry_max_seconds: float):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+    def retry_delay(self, attempts: int) -> float:
+        # Exponential backoff with jitter, so a burst of failures does not retry in lockstep
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+
+class JobRegistry:
+    def __init__(self):
+        self.types: Dict[str, JobType] = {}
+
+    def handler(self, name: str, concurrency: int = 4, max_attempts: int = 5, visibility_timeout: float = 60.0,
+                retry_base_seconds: float = 2.0, retry_max_seconds: float = 300.0):
+        def register(func):
+            self.types[name] = JobType(name, func, concurrency, max_attempts, visibility_timeout,
+                                       retry_base_seconds, retry_max_seconds)
+            return func
+        return register
+
+
+class JobQueue:
+    def __init__(self, collection, registry: JobRegistry, retention_seconds: float = 7 * 86400):
+        self.collection = collection
+        self.registry = registry
+        self.retention = timedelta(seconds=retention_seconds)
+        # Set on enqueue so a worker in the same process picks the job up without polling
+        self.enqueued = asyncio.Event()
+
+    def _document(self, job_type: str, payload: dict, delay: float, now: datetime) -> dict:
+        if job_type not in self.registry.types:
+            raise ValueError(f"Unknown job type {job_type}")
+        return {
+            "type": job_type,
+            "payload": payload,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": self.registry.types[job_type].max_attempts,
+            "available_at": now + timedelta(seconds=delay),
+            "lease": None,
+            "created_at": now,
+            "finished_at": None,
+            "expires_at": None,
+            "last_error": None,
+        }
+
+    async def enqueue(self, job_type: str, payload: dict, delay: float = 0):
+        await self.enqueue_many([(job_type, payload)], delay)
+
+    async def enqueue_many(self, jobs: List[Tuple[str, dict]], delay: float = 0):
+        """Insert several jobs in one round trip."""
+        if not jobs:
+            return
+        now = datetime.utcnow()
+        await self.collection.insert_many([self._document(job_type, payload, delay, now) for job_type, payload in jobs])
+        self.enqueued.set()
+
+    async def claim(self, types: List[str], visibility_timeout: float, worker_id: str) -> Optional[dict]:
+        """Lease the oldest due job of these types; expired leases count as due."""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"status": {"$in": [QUEUED, RUNNING]}, "type": {"$in": types}, "available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "available_at": now + timedelta(seconds=visibility_timeout),
+                    "lease": uuid.uuid4().hex,
+                    "worker": worker_id,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _finish(self, job: dict, update: dict) -> bool:
+        # Matching the lease keeps a worker whose lease expired from touching the new attempt
+        result = await self.collection.update_one({"_id": job["_id"], "lease": job["lease"]}, update)
+        if not result.matched_count:
+            logger.warning("Lost the lease on %s job %s before it finished", job["type"], job["_id"])
+        return bool(result.matched_count)
+
+    async def complete(self, job: dict) -> bool:
+        now = datetime.utcnow()
+        return await self._finish(job, {"$set": {
+            "status": DONE, "finished_at": now, "expires_at": now + self.retention, "lease": None
+        }})
+
+    async def fail(self, job: dict, error: str, retry_delay: float) -> bool:
+        now = datetime.utcnow()
+        if job["attempts"] >= job["max_attempts"]:
+            update = {"status": FAILED, "finished_at": now, "expires_at": now + self.retention, "lease": None,
+                      "last_error": error}
+        else:
+            update = {"status": QUEUED, "available_at": now + timedelta(seconds=retry_delay), "lease": None,
+                      "last_error": error}
+        return await self._finish(job, {"$set": update})
+
+    async def release(self, job: dict) -> bool:
+        """Hand an unfinished job back without counting the attempt (worker shutting down)."""
+        return await self._finish(job, {
+            "$set": {"status": QUEUED, "available_at": datetime.utcnow(), "lease": None},
+            "$inc": {"attempts": -1},
+        })
+
+    async def purge_expired(self) -> int:
+        """Delete finished jobs past their retention, for storage without TTL indexes."""
+        result = await self.collection.delete_many({"expires_at": {"$lte": datetime.utcnow()}})
+        return result.deleted_count
+
+    async def counts(self) -> dict:
+        pipeline = [{"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}]
+        counts = {}
+        async for row in self.collection.aggregate(pipeline):
+            counts.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+        return counts
+
+
+class JobWorker:
+    """Claims and runs jobs with a total and a per-type concurrency limit."""
+
+    def __init__(self, queue: JobQueue, concurrency: int = 8, poll_interval: float = 1.0,
+                 types: Optional[List[str]] = None, purge_interval: Optional[float] = None):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.types = {name: queue.registry.types[name] for name in (types or queue.registry.types)}
+        self.worker_id = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self.running: Dict[str, int] = {name: 0 for name in self.types}
+        self.tasks = set()
+        self._stopping = False
+        self._slot_freed = asyncio.Event()
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+
+    def _claimable(self) -> Dict[float, List[str]]:
+        """Types with a free slot, grouped by visibility timeout (one claim query per group)."""
+        if len(self.tasks) >= self.concurrency:
+            return {}
+        groups = {}
+        for name, job_type in self.types.items():
+            if self.running[name] < job_type.concurrency:
+                groups.setdefault(job_type.visibility_timeout, []).append(name)
+        return groups
+
+    async def _claim_next(self) -> bool:
+        for visibility_timeout, names in self._claimable().items():
+            job = await self.queue.claim(names, visibility_timeout, self.worker_id)
+            if job is not None:
+                self._start(job)
+                return True
+        return False
+
+    def _start(self, job: dict):
+        self.running[job["type"]] += 1
+        task = asyncio.create_task(self._execute(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _execute(self, job: dict):
+        job_type = self.types[job["type"]]
+        try:
+            if job["attempts"] > job["max_attempts"]:
+                # Every attempt so far ended with an expired lease (worker crash or hang)
+                await self.queue.fail(job, "Lease expired on every attempt", 0)
+                return
+            # A handler still running when its lease expires would race the next claim
+            await asyncio.wait_for(job_type.handler(job["payload"]), job_type.visibility_timeout)
+        except asyncio.CancelledError:
+            await self.queue.release(job)
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning("Job %s (%s) attempt %d failed: %s", job["_id"], job["type"], job["attempts"], error)
+            await self.queue.fail(job, error, job_type.retry_delay(job["attempts"]))
+        else:
+            await self.queue.complete(job)
+        finally:
+            self.running[job["type"]] -= 1
+            self._slot_freed.set()
+
+    async def _wait(self, timeout: float):
+        # Wake on a new local enqueue, a freed slot or the poll interval, whichever comes first
+        waiters = [asyncio.ensure_future(self.queue.enqueued.wait()), asyncio.ensure_future(self._slot_freed.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        self.queue.enqueued.clear()
+        self._slot_freed.clear()
+
+    async def _purge_if_due(self):
+        if self.purge_interval and time.monotonic() - self._purged_at >= self.purge_interval:
+            self._purged_at = time.monotonic()
+            purged = await self.queue.purge_expired()
+            if purged:
+                logger.info("Purged %d finished jobs", purged)
+
+    async def run(self):
+        logger.info("Job worker %s running %s", self.worker_id, ", ".join(self.types))
+        while not self._stopping:
+            try:
+                await self._purge_if_due()
+                claimed = await self._claim_next()
+            except PyMongoError:
+                logger.exception("Could not claim a job")
+                claimed = False
+            if not claimed:
+                await self._wait(self.poll_interval)
+
+    async def drain(self):
+        """Run due jobs until none are left, then return (maintenance and tests)."""
+        while True:
+            while await self._claim_next():
+                pass
+            if not self.tasks:
+                return
+            await asyncio.wait(set(self.tasks), return_when=asyncio.FIRST_COMPLETED)
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop claiming, let running jobs finish for up to timeout, then hand the rest back."""
+        self._stopping = True
+        self._slot_freed.set()
+        if self.tasks:
+            _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+import server
+from memory_engine import MemoryClient
+from server import (
+    connect_database, ensure_indexes, check_indexes, store_image, reconcile_user_stats, rebuild_price_rollups,
+    DASHBOARD_FIELDS, OrderStatus, ProduceCategory, Region, UserRole
+)
+
+db = None  # opened in main()
+
+
+async def cmd_ensure_indexes(args):
+    await ensure_indexes(db)
+    print("Indexes ensured")
+    return 0
+
+
+async def cmd_check_indexes(args):
+    report = await check_indexes(db)
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if report["missing_indexes"] or report["collection_scans"] else 0
+
+
+async def cmd_migrate_images(args):
+    # Move inline base64 images into the image store, leaving only image_id behind
+    migrated = failed = 0
+    cursor = db.produce.find({"image_data": {"$ne": None}}, {"id": 1, "image_data": 1}, batch_size=args.batch_size)
+    async for produce in cursor:
+        try:
+            image_id = await store_image(base64.b64decode(produce["image_data"]))
+        except (binascii.Error, HTTPException) as e:
+            failed += 1
+            print(f"Skipping produce {produce['id']}: {getattr(e, 'detail', e)}")
+            continue
+        await db.produce.update_one(
+            {"_id": produce["_id"]},
+            {"$set": {"image_id": image_id}, "$unset": {"image_data": ""}}
+        )
+        migrated += 1
+    print(f"Migrated {migrated} images, {failed} failed")
+    return 1 if failed else 0
+
+
+async def cmd_reconcile_stats(args):
+    # Rebuild every dashboard counter document from produce and orders
+    reconciled = 0
+    query = {"role": {"$in": [role.value for role in DASHBOARD_FIELDS]}}
+    async for user in db.users.find(query, {"id": 1, "role": 1}):
+        await reconcile_user_stats(user["id"], user["role"])
+        reconciled += 1
+    print(f"Reconciled counters for {reconciled} users")
+    return 0
+
+
+async def cmd_rebuild_price_rollups(args):
+    # Live order writes during the rebuild can be lost; run it while traffic is quiet
+    folded = await rebuild_price_rollups(db, batch_size=args.batch_size)
+    print(f"Rebuilt price rollups from {folded} orders")
+    return 0
+
+
+async def cmd_job_stats(args):
+    counts = await server.get_job_queue().counts()
+    print(json.dumps(counts, indent=2))
+    return 1 if any(statuses.get("failed") for statuses in counts.values()) else 0
+
+
+def parity_seed(count: int) -> dict:
+    """Listings and orders that exercise every filter, sort key and aggregation the routes use."""
+    rng = random.Random(16)
+    start = datetime(2024, 1, 1)
+    produce = []
+    for i in range(count):
+        produce.append({
+            "id": f"produce-{i:05d}", "unique_code": f"P{i:05d}", "farmer_id": f"farmer-{i % 7}",
+            "farmer_name": f"Farmer {i % 7}", "title": rng.choice(["Maize", "Fresh tomatoes", "Yam tubers", "Goat"]),
+            "description": rng.choice(["dried maize", "ripe and red", "from the north", ""]),
+            "category": rng.choice(list(ProduceCategory)).value, "region": rng.choice(list(Region)).value,
+            "price": round(rng.uniform(1, 1500), 2), "quantity": rng.randrange(0, 50), "unit": "kg",
+            "is_available": rng.random() < 0.8,
+            # Several listings share a timestamp, so the id tie-break is exercised
+            "created_at": start + timedelta(minutes=rng.randrange(count // 2 or 1)),
+            "location": {"type": "Point", "coordinates": [rng.uniform(-3, 1), rng.uniform(5, 8)]},
+        })
+    orders = []
+    for i in range(count * 2):
+        listing = rng.choice(produce)
+        orders.append({
+            "id": f"order-{i:05d}", "produce_id": listing["id"], "farmer_id": listing["farmer_id"],
+            "buyer_id": f"buyer-{i % 5}", "category": listing["category"], "region": listing["region"],
+            "quantity": rng.randrange(1, 5), "unit_price": listing["price"],
+            "status": rng.choice(list(OrderStatus)).value,
+            "created_at": start + timedelta(minutes=rng.randrange(60 * 24 * 10)),
+        })
+    return {"produce": produce, "orders": orders}
+
+
+def parity_checks() -> dict:
+    """Route queries to run on both engines, each returning something comparable."""
+    available = {"is_available": True}
+    filtered = {"is_available": True, "category": ProduceCategory.GRAINS.value, "region": Region.ACCRA.value}
+
+    async def pages(query):
+        first = await server.fetch_produce_page(query, None, 20)
+        second = await server.fetch_produce_page(query, first["next_cursor"], 20)
+        return [[item["id"] for item in page["items"]] for page in (first, second)]
+
+    async def search():
+        page = await server.search_produce_page(available, "maize", None, 200)
+        return sorted(item["id"] for item in page["items"])
+
+    async def nearby():
+        page = await server.fetch_nearby_produce_page(available, 5.6, -0.19, 200, None, 30)
+        return [(item["id"], round(item["distance_km"])) for item in page["items"]]
+
+    async def stock():
+        # Reserve more than some listings hold, then put it all back
+        quantities = {f"produce-{i:05d}": 10 for i in range(0, 40, 3)}
+        reserved = await server.reserve_stock_bulk(quantities)
+        after_reserve = await server.db.produce.find(
+            {"id": {"$in": list(quantities)}}, {"_id": 0, "id": 1, "quantity": 1, "is_available": 1}
+        ).to_list(None)
+        await server.release_stock_bulk({pid: quantities[pid] for pid in reserved})
+        after_release = await server.db.produce.find(
+            {"id": {"$in": list(quantities)}}, {"_id": 0, "id": 1, "quantity": 1, "is_available": 1}
+        ).to_list(None)
+        return sorted(reserved), sorted(after_reserve, key=lambda p: p["id"]), sorted(after_release, key=lambda p: p["id"])
+
+    async def rollups():
+        await rebuild_price_rollups(server.db)
+        return await server.db.price_rollups.find({"granularity": "day"}, {"_id": 0}).sort(
+            [("category", 1), ("region", 1), ("bucket", 1)]
+        ).to_list(None)
+
+    return {
+        "catalog": lambda: pages(available),
+        "catalog filtered": lambda: pages(filtered),
+        "farmer listing": lambda: pages({"farmer_id": "farmer-3"}),
+        "search": search,
+        "nearby": nearby,
+        "facets": lambda: server.compute_produce_facets(available, None, None),
+        "facets filtered": lambda: server.compute_produce_facets(available, ProduceCategory.FRUITS.value, None),
+        "farmer stats": lambda: server.aggregate_user_stats("farmer-2", UserRole.FARMER),
+        "buyer stats": lambda: server.aggregate_user_stats("buyer-1", UserRole.BUYER),
+        "stock": stock,
+        "rollups": rollups,
+    }
+
+
+async def cmd_check_memory_engine(args):
+    # Same seed, same route queries, MongoDB vs the memory engine; any difference is an engine bug
+    if server.STORAGE_ENGINE == "memory":
+        print("check-memory-engine compares against MongoDB; run it with STORAGE_ENGINE=mongo")
+        return 2
+    seed = parity_seed(args.count)
+    results = {}
+    mongo_db = server.client[f"{db.name}_engine_parity"]
+    for engine, database in (("mongo", mongo_db), ("memory", MemoryClient()["parity"])):
+        await database.client.drop_database(database.name)
+        await ensure_indexes(database)
+        for collection, docs in seed.items():
+            await database[collection].insert_many([dict(doc) for doc in docs])
+        server.db = database
+        server._response_cache = None
+        results[engine] = {name: await check() for name, check in parity_checks().items()}
+    server.db = db
+    await server.client.drop_database(mongo_db.name)
+
+    def canonical(value):
+        # Float sums depend on the order documents are folded in, so compare them to 6 places
+        if isinstance(value, float):
+            return round(value, 6)
+        if isinstance(value, dict):
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [canonical(item) for item in value]
+        return value
+
+    mismatches = 0
+    for name in results["mongo"]:
+        mongo_result = json.dumps(canonical(results["mongo"][name]), default=str, sort_keys=True)
+        memory_result = json.dumps(canonical(results["memory"][name]), default=str, sort_keys=True)
+        if mongo_result == memory_result:
+            print(f"ok        {name}")
+        else:
+            mismatches += 1
+            print(f"MISMATCH  {name}\n  mongo:  {mongo_result}\n  memory: {memory_result}")
+    return 1 if mismatches else 0
+
+
+COMMANDS = {
+    "ensure-indexes": (cmd_ensure_indexes, "Create every index declared in server.INDEXES"),
+    "check-indexes": (cmd_check_indexes, "Report missing indexes and collection-scan query plans"),
+    "migrate-images": (cmd_migrate_images, "Move inline produce images into the image store"),
+    "reconcile-stats": (cmd_reconcile_stats, "Rebuild dashboard counters from produce and orders"),
+    "rebuild-price-rollups": (cmd_rebuild_price_rollups, "Recompute hourly and daily price rollups from orders"),
+    "job-stats": (cmd_job_stats, "Count background jobs by type and status"),
+    "check-memory-engine": (cmd_check_memory_engine, "Diff the route queries on MongoDB and the memory engine"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agricultural marketplace maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text)
+    subparsers.choices["migrate-images"].add_argument("--batch-size", type=int, default=100)
+    subparsers.choices["rebuild-price-rollups"].add_argument("--batch-size", type=int, default=1000)
+    subparsers.choices["check-memory-engine"].add_argument("--count", type=int, default=500,
+                                                           help="Listings to seed (orders are twice this)")
+    args = parser.parse_args()
+
+    global db
+    db = connect_database()
+    handler, _ = COMMANDS[args.command]
+    try:
+        return asyncio.run(handler(args))
+    finally:
+        server.client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,975 @@
+"""In-memory storage engine exposing the subset of the Motor API that server.py uses.
+
+Select it with STORAGE_ENGINE=memory. Collections keep documents in a dict keyed
+by _id, with hash indexes on every field named in a create_index() call (so
+ensure_indexes() gives it id, email, farmer_id, buyer_id, category, region, ...).
+Queries with an equality or $in condition on an indexed field only visit the
+matching documents, and skip per-document matching when those conditions are the
+whole query. Compound indexes are also kept sorted, so a sorted, limited find whose
+equality conditions cover the keys before the sort fields walks the index and
+stops after the page, as Mongo would. Everything else is a scan. All operations
+run synchronously on the event loop, so each one is atomic just like a
+single-document Mongo write.
+
+Only what the routes use is implemented: find/find_one (projection, sort, skip,
+limit), insert_one/insert_many, update_one/update_many, replace_one, delete_many,
+find_one_and_update, bulk_write of UpdateOne, create_index and index_information.
+Query operators: $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $elemMatch, $and, $or
+and $text. Updates: $set, $setOnInsert, $unset, $inc, $min, $max, $push, $pull.
+Aggregation: $match, $project, $addFields, $unionWith, $facet, $count, $group
+($sum, $min, $max), $bucket, $sort, $limit and a leading $geoNear; expressions
+are field paths, literals and {"$meta": "textScore"}. A text index is kept as an
+inverted index for $text in a leading $match; $geoNear is answered by a scan with
+haversine distances. Anything else raises OperationFailure. `python manage.py
+check-memory-engine` runs the route queries against MongoDB and this engine and
+reports any difference.
+
+Documents are round-tripped through BSON on the way in and out, which gives the
+same normalisation as Mongo (millisecond datetimes, enums stored as strings) and
+keeps callers from mutating stored state; reads copy only the documents they
+return. MemoryClient can snapshot every collection to a directory and load it
+back at startup.
+"""
+import asyncio
+import bisect
+import heapq
+import math
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import bson
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+)
+
+_MISSING = object()
+# Hidden field carrying the $text relevance score through an aggregation pipeline
+TEXT_SCORE_FIELD = "__text_score"
+# Radius Mongo uses for spherical distances, in metres
+EARTH_RADIUS_METERS = 6378100
+# Below this many indexed candidates a sorted page is cheaper to select from the bucket than to walk
+ORDERED_WALK_MIN_CANDIDATES = 1000
+STOP_WORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+              "of", "on", "or", "the", "to", "with"}
+
+
+def _clone(doc: dict) -> dict:
+    return bson.decode(bson.encode(doc))
+
+
+def _get_path(doc, path: str):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+# Mongo's cross-type ordering, reduced to the types this app stores
+def _type_rank(value) -> int:
+    if value is _MISSING or value is None:
+        return 0
+    if isinstance(value, bool):
+        return 5
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 6
+    return 7
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    return (rank, None if rank == 0 else value)
+
+
+def _compare(left, right) -> Optional[int]:
+    if _type_rank(left) != _type_rank(right):
+        return None
+    try:
+        return (left > right) - (left < right)
+    except TypeError:
+        return None
+
+
+def _values_equal(value, target) -> bool:
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(_values_equal(item, target) for item in value)
+    return value == target
+
+
+def _match_operator(value, operator: str, argument) -> bool:
+    candidates = value if isinstance(value, list) else [value]
+    if operator == "$eq":
+        return _values_equal(value, argument)
+    if operator == "$ne":
+        return not _values_equal(value, argument)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        for candidate in candidates:
+            result = _compare(candidate, argument)
+            if result is not None and {
+                "$gt": result > 0, "$gte": result >= 0, "$lt": result < 0, "$lte": result <= 0
+            }[operator]:
+                return True
+        return False
+    if operator == "$in":
+        return any(_values_equal(value, item) for item in argument)
+    if operator == "$nin":
+        return not any(_values_equal(value, item) for item in argument)
+    if operator == "$elemMatch":
+        return isinstance(value, list) and any(
+            match(item, argument) if isinstance(item, dict) else _match_condition(item, argument)
+            for item in value
+        )
+    raise OperationFailure(f"Unsupported query operator {operator} in the memory engine")
+
+
+def _match_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return all(_match_operator(value, op, arg) for op, arg in condition.items())
+    return _values_equal(value, condition)
+
+
+def match(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$text":
+            continue  # resolved against the text index by MemoryCollection._matching
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and any(fields.values()):
+        result = {}
+        if include_id and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for field in fields:
+            value = _get_path(doc, field)
+            if value is not _MISSING:
+                _set_path(result, field, value)
+        return result
+    result = dict(doc)
+    for field in fields:
+        _unset_path(result, field)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def sort_documents(docs: List[dict], sort, limit: Optional[int] = None) -> List[dict]:
+    sort = list(sort)
+    if limit is not None and len({direction > 0 for _, direction in sort}) == 1:
+        # Only the first `limit` are wanted: a heap selection costs O(n log limit) instead of a full sort
+        select = heapq.nsmallest if sort[0][1] > 0 else heapq.nlargest
+        return select(limit, docs, key=lambda doc: tuple(_sort_key(_get_path(doc, field)) for field, _ in sort))
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=direction < 0)
+    return docs
+
+
+def _stem(word: str) -> str:
+    """Plural folding, so "tomatoes" finds "tomato" the way Mongo's English stemmer does."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def text_tokens(text) -> List[str]:
+    return [_stem(word) for word in re.findall(r"\w+", str(text).lower()) if word not in STOP_WORDS]
+
+
+def haversine_meters(origin: List[float], point: List[float]) -> float:
+    """Great-circle distance between two GeoJSON [longitude, latitude] pairs."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (*origin, *point))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _equalities(query: dict) -> dict:
+    """Fields a query pins to a single scalar, including inside a top-level $and."""
+    pinned = {}
+    for key, condition in query.items():
+        if key == "$and":
+            for sub in condition:
+                pinned.update(_equalities(sub))
+        elif not key.startswith("$"):
+            if isinstance(condition, dict) and set(condition) == {"$eq"}:
+                condition = condition["$eq"]
+            if not isinstance(condition, (dict, list)):
+                pinned[key] = condition
+    return pinned
+
+
+def _ordered_key(doc: dict, fields: List[str]) -> tuple:
+    values = [_get_path(doc, field) for field in fields]
+    if any(isinstance(value, (dict, list)) for value in values):
+        raise TypeError("array and subdocument values are not kept in order")
+    return tuple(_sort_key(value) for value in values)
+
+
+def _normalize_keys(keys) -> List[tuple]:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return [(key, direction) for key, direction in (keys.items() if isinstance(keys, dict) else keys)]
+
+
+# Update operators
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+    if not any(key.startswith("$") for key in update):
+        replacement = dict(update)
+        replacement["_id"] = doc["_id"]
+        return replacement
+    doc = _clone(doc)
+    for operator, fields in update.items():
+        for path, argument in fields.items():
+            current = _get_path(doc, path)
+            if operator == "$set":
+                _set_path(doc, path, argument)
+            elif operator == "$setOnInsert":
+                if inserting:
+                    _set_path(doc, path, argument)
+            elif operator == "$unset":
+                _unset_path(doc, path)
+            elif operator == "$inc":
+                _set_path(doc, path, (0 if current is _MISSING else current) + argument)
+            elif operator == "$min":
+                if current is _MISSING or _sort_key(argument) < _sort_key(current):
+                    _set_path(doc, path, argument)
+            elif operator == "$max":
+                if current is _MISSING or _sort_key(argument) > _sort_key(current):
+                    _set_path(doc, path, argument)
+            elif operator == "$push":
+                _set_path(doc, path, ([] if current is _MISSING else list(current)) + [argument])
+            elif operator == "$pull":
+                if isinstance(current, list):
+                    _set_path(doc, path, [item for item in current if not _pull_matches(item, argument)])
+            else:
+                raise OperationFailure(f"Unsupported update operator {operator} in the memory engine")
+    return doc
+
+
+def _pull_matches(item, condition) -> bool:
+    # A condition on fields, like {"id": ...}, matches array elements that are subdocuments
+    if isinstance(item, dict) and isinstance(condition, dict) and not all(k.startswith("$") for k in condition):
+        return match(item, condition)
+    return _match_condition(item, condition)
+
+
+def _upsert_seed(query: dict) -> dict:
+    seed = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set_path(seed, key, condition["$eq"])
+        else:
+            _set_path(seed, key, condition)
+    return seed
+
+
+# Aggregation expressions
+def evaluate(expression, doc: dict):
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [evaluate(item, doc) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1:
+        operator, argument = next(iter(expression.items()))
+        if operator.startswith("$"):
+            return _evaluate_operator(operator, argument, doc)
+    return {key: evaluate(value, doc) for key, value in expression.items()}
+
+
+def _evaluate_operator(operator: str, argument, doc: dict):
+    if operator == "$meta":
+        return doc.get(TEXT_SCORE_FIELD) if argument == "textScore" else None
+    raise OperationFailure(f"Unsupported expression operator {operator} in the memory engine")
+
+
+def _accumulate(operator: str, values: list):
+    present = [value for value in values if value is not None]
+    if operator == "$sum":
+        return sum(value for value in present if isinstance(value, (int, float)))
+    if operator == "$min":
+        return min(present, key=_sort_key) if present else None
+    if operator == "$max":
+        return max(present, key=_sort_key) if present else None
+    raise OperationFailure(f"Unsupported accumulator {operator} in the memory engine")
+
+
+class MemoryCursor:
+    """Lazy result set with the chaining and iteration API of a Motor cursor."""
+
+    def __init__(self, loader):
+        # loader(sort, skip, limit) returns the page of result documents
+        self._loader = loader
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _materialize(self) -> List[dict]:
+        if self._results is None:
+            self._results = self._loader(self._sort, self._skip, self._limit)
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        docs = self._materialize()
+        result = docs if length is None else docs[:length]
+        self._results = docs[len(result):]
+        return result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        docs = self._materialize()
+        if not docs:
+            raise StopAsyncIteration
+        return docs.pop(0)
+
+
+class MemoryCollection:
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+        self._indexes: Dict[str, dict] = {"_id_": {"key": [("_id", 1)], "unique": True}}
+        self._hashed: Dict[str, Dict[Any, set]] = {}
+        # Inverted index for the collection's text index: weights per field, token -> {oid: score}
+        self._text_weights: Optional[Dict[str, float]] = None
+        self._postings: Dict[str, Dict[Any, float]] = {}
+        self._geo_fields: set = set()
+        # Compound indexes also keep sorted (key, oid) entries, so a sorted page is read in index order;
+        # entries become None if a document holds a value that cannot be ordered
+        self._ordered: Dict[str, tuple] = {}
+
+    # Indexes
+    def _hash_values(self, doc: dict, field: str) -> list:
+        value = _get_path(doc, field)
+        if value is _MISSING:
+            return [None]
+        values = value if isinstance(value, list) else [value]
+        return [item for item in values if not isinstance(item, (dict, list))]
+
+    def _text_scores(self, doc: dict) -> Dict[str, float]:
+        # Per field: weight * (0.5 + 0.5 * term frequency), close to Mongo's textScore
+        scores = {}
+        for field, weight in self._text_weights.items():
+            value = _get_path(doc, field)
+            if value is _MISSING or value is None:
+                continue
+            tokens = text_tokens(" ".join(value) if isinstance(value, list) else value)
+            for token in set(tokens):
+                frequency = tokens.count(token) / len(tokens)
+                scores[token] = scores.get(token, 0.0) + weight * (0.5 + 0.5 * frequency)
+        return scores
+
+    def _index_add(self, oid, doc: dict):
+        for name, (fields, entries) in self._ordered.items():
+            if entries is not None:
+                try:
+                    bisect.insort(entries, (_ordered_key(doc, fields), oid))
+                except TypeError:
+                    self._ordered[name] = (fields, None)
+        for field, table in self._hashed.items():
+            for value in self._hash_values(doc, field):
+                table.setdefault(value, set()).add(oid)
+        if self._text_weights is not None:
+            for token, score in self._text_scores(doc).items():
+                self._postings.setdefault(token, {})[oid] = score
+
+    def _index_remove(self, oid, doc: dict):
+        for fields, entries in self._ordered.values():
+            if entries is not None:
+                entry = (_ordered_key(doc, fields), oid)
+                position = bisect.bisect_left(entries, entry)
+                if position < len(entries) and entries[position] == entry:
+                    del entries[position]
+        for field, table in self._hashed.items():
+            for value in self._hash_values(doc, field):
+                bucket = table.get(value)
+                if bucket is not None:
+                    bucket.discard(oid)
+                    if not bucket:
+                        del table[value]
+        if self._text_weights is not None:
+            for token in self._text_scores(doc):
+                posting = self._postings.get(token)
+                if posting is not None:
+                    posting.pop(oid, None)
+                    if not posting:
+                        del self._postings[token]
+
+    def _text_search(self, spec: dict) -> Dict[Any, float]:
+        if self._text_weights is None:
+            raise OperationFailure("text index required for $text query", 27)
+        scores = {}
+        for token in set(text_tokens(spec["$search"])):
+            for oid, score in self._postings.get(token, {}).items():
+                scores[oid] = scores.get(oid, 0.0) + score
+        return scores
+
+    def _check_unique(self, doc: dict, ignore_oid=None):
+        for name, spec in self._indexes.items():
+            if not spec.get("unique") or name == "_id_":
+                continue
+            fields = [field for field, _ in spec["key"]]
+            key = tuple(_get_path(doc, field) for field in fields)
+            candidates = self._hashed[fields[0]].get(None if key[0] is _MISSING else key[0], set())
+            for oid in candidates:
+                if oid != ignore_oid and tuple(_get_path(self._docs[oid], f) for f in fields) == key:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {name}", 11000
+                    )
+
+    async def create_index(self, keys, name: Optional[str] = None, unique: bool = False, **kwargs) -> str:
+        keys = _normalize_keys(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        text_fields = [field for field, direction in keys if direction == "text"]
+        if text_fields:
+            weights = kwargs.get("weights", {})
+            self._text_weights = {field: float(weights.get(field, 1)) for field in text_fields}
+            self._postings = {}
+            for oid, doc in self._docs.items():
+                for token, score in self._text_scores(doc).items():
+                    self._postings.setdefault(token, {})[oid] = score
+        self._geo_fields.update(field for field, direction in keys if direction == "2dsphere")
+        for field, direction in keys:
+            if direction not in ("text", "2dsphere") and field not in self._hashed:
+                self._hashed[field] = {}
+                for oid, doc in self._docs.items():
+                    for value in self._hash_values(doc, field):
+                        self._hashed[field].setdefault(value, set()).add(oid)
+        if len(keys) > 1 and not text_fields and name not in self._ordered and not any(
+                direction == "2dsphere" for _, direction in keys):
+            fields = [field for field, _ in keys]
+            try:
+                entries = sorted((_ordered_key(doc, fields), oid) for oid, doc in self._docs.items())
+            except TypeError:
+                entries = None
+            self._ordered[name] = (fields, entries)
+        spec = {"key": keys}
+        if unique:
+            spec["unique"] = True
+            seen = set()
+            for doc in self._docs.values():
+                key = tuple(repr(_get_path(doc, field)) for field, _ in keys)
+                if key in seen:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+                seen.add(key)
+        for option in ("expireAfterSeconds", "weights", "default_language"):
+            if option in kwargs:
+                spec[option] = kwargs[option]
+        self._indexes[name] = spec
+        return name
+
+    async def index_information(self) -> dict:
+        return {name: {**spec, "v": 2} for name, spec in self._indexes.items()}
+
+    def _bucket(self, key: str, condition) -> Optional[set]:
+        """The oids an equality or $in condition on an indexed field selects, or None if it is not one."""
+        if key == "_id" and not isinstance(condition, dict):
+            return {condition} if condition in self._docs else set()
+        if key not in self._hashed:
+            return None
+        table = self._hashed[key]
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if set(condition) == {"$eq"} and not isinstance(condition["$eq"], (dict, list)):
+                return table.get(condition["$eq"], set())
+            if set(condition) == {"$in"} and not any(isinstance(value, (dict, list)) for value in condition["$in"]):
+                return set().union(*(table.get(value, set()) for value in condition["$in"]))
+            return None
+        if isinstance(condition, (dict, list)):
+            return None
+        return table.get(condition, set())
+
+    def _candidates(self, query: Optional[dict]):
+        """Narrow a query to its indexed buckets; True alongside them if the buckets answer it exactly."""
+        best, exact = None, bool(query)
+        for key, condition in (query or {}).items():
+            if key == "$and":
+                for sub in condition:
+                    oids, _ = self._candidates(sub)
+                    if oids is not None and (best is None or len(oids) < len(best)):
+                        best = oids
+                exact = False
+                continue
+            oids = self._bucket(key, condition)
+            if oids is None:
+                exact = False
+            elif best is None:
+                best = oids
+            elif exact:
+                best = best & oids
+            elif len(oids) < len(best):
+                best = oids
+        return best, exact and best is not None
+
+    def _matching(self, query: Optional[dict], text_scores: Optional[dict] = None) -> List[tuple]:
+        candidates, exact = self._candidates(query)
+        if query and "$text" in query:
+            scores = self._text_search(query["$text"])
+            if text_scores is not None:
+                text_scores.update(scores)
+            candidates = scores.keys() if candidates is None else candidates & scores.keys()
+            exact = False
+        if candidates is None:
+            items = list(self._docs.items())
+        else:
+            items = [(oid, self._docs[oid]) for oid in list(candidates)]
+        if exact:
+            # Every condition was an equality answered by its index bucket
+            return items
+        return [(oid, doc) for oid, doc in items if match(doc, query)]
+
+    def _ordered_walk(self, query: Optional[dict], sort: List[tuple], end: int) -> Optional[List[tuple]]:
+        """The first `end` matches in sort order, read from a compound index that serves the sort.
+        
+        The index must pin every key before the sort fields with an equality in the query; None if no
+        index does, or if the query's indexed bucket is small enough to select from directly.
+        """
+        query = query or {}
+        if "$text" in query or len({direction > 0 for _, direction in sort}) != 1:
+            return None
+        candidates, _ = self._candidates(query)
+        if candidates is not None and len(candidates) < ORDERED_WALK_MIN_CANDIDATES:
+            return None
+        pinned = _equalities(query)
+        sort_fields = [field for field, _ in sort]
+        for fields, entries in self._ordered.values():
+            if entries is None:
+                continue
+            prefix = 0
+            while prefix < len(fields) and fields[prefix] in pinned and fields[prefix] not in sort_fields:
+                prefix += 1
+            if fields[prefix:prefix + len(sort_fields)] != sort_fields:
+                continue
+            bound = tuple(_sort_key(pinned[field]) for field in fields[:prefix])
+            low = bisect.bisect_left(entries, bound, key=lambda entry: entry[0][:prefix])
+            high = bisect.bisect_right(entries, bound, key=lambda entry: entry[0][:prefix])
+            positions = range(low, high) if sort[0][1] > 0 else range(high - 1, low - 1, -1)
+            matches = []
+            for position in positions:
+                oid = entries[position][1]
+                if match(self._docs[oid], query):
+                    matches.append((oid, self._docs[oid]))
+                    if len(matches) == end:
+                        break
+            return matches
+        return None
+
+    def _first(self, query: Optional[dict], sort=None) -> Optional[tuple]:
+        if sort:
+            walked = self._ordered_walk(query, _normalize_keys(sort), 1)
+            if walked is not None:
+                return walked[0] if walked else None
+        matches = self._matching(query)
+        if sort:
+            docs = sort_documents([doc for _, doc in matches], _normalize_keys(sort))
+            return (docs[0]["_id"], docs[0]) if docs else None
+        return matches[0] if matches else None
+
+    # Writes
+    def _insert(self, doc: dict) -> Any:
+        doc = _clone(doc)
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = doc
+        self._index_add(doc["_id"], doc)
+        return doc["_id"]
+
+    def _replace(self, oid, new_doc: dict):
+        self._check_unique(new_doc, ignore_oid=oid)
+        self._index_remove(oid, self._docs[oid])
+        self._docs[oid] = new_doc
+        self._index_add(oid, new_doc)
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> dict:
+        matches = self._matching(query)
+        if not many:
+            matches = matches[:1]
+        modified = 0
+        for oid, doc in matches:
+            new_doc = apply_update(doc, update)
+            if new_doc != doc:
+                self._replace(oid, new_doc)
+                modified += 1
+        raw = {"n": len(matches), "nModified": modified}
+        if not matches and upsert:
+            seed = _upsert_seed(query)
+            seed.setdefault("_id", ObjectId())
+            raw["upserted"] = self._insert(apply_update(seed, update, inserting=True))
+            raw["n"] = 1
+        return raw
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        inserted_id = self._insert(document)
+        document.setdefault("_id", inserted_id)
+        return InsertOneResult(inserted_id, True)
+
+    async def insert_many(self, documents, ordered: bool = True) -> InsertManyResult:
+        inserted_ids, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"nInserted": len(inserted_ids), "writeErrors": errors, "upserted": [],
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0})
+        return InsertManyResult(inserted_ids, True)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=False), True)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, many=False), True)
+
+    def _delete(self, query: dict, many: bool) -> int:
+        matches = self._matching(query)
+        if not many:
+            matches = matches[:1]
+        for oid, doc in matches:
+            self._index_remove(oid, doc)
+            del self._docs[oid]
+        return len(matches)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection=None, sort=None,
+                                  upsert: bool = False, return_document: bool = False, **kwargs):
+        found = self._first(filter, sort)
+        if found is None:
+            if not upsert:
+                return None
+            raw = self._update(filter, update, upsert=True, many=False)
+            return project(_clone(self._docs[raw["upserted"]]), projection) if return_document else None
+        oid, doc = found
+        new_doc = apply_update(doc, update)
+        if new_doc != doc:
+            self._replace(oid, new_doc)
+        return project(_clone(new_doc if return_document else doc), projection)
+
+    async def bulk_write(self, requests, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if not isinstance(request, UpdateOne):
+                    raise OperationFailure(f"Unsupported bulk operation {type(request).__name__}")
+                raw = self._update(request._filter, request._doc, bool(request._upsert), many=False)
+                if "upserted" in raw:
+                    result["nUpserted"] += 1
+                    result["upserted"].append({"index": index, "_id": raw["upserted"]})
+                else:
+                    result["nMatched"] += raw["n"]
+                    result["nModified"] += raw["nModified"]
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        result.pop("writeErrors")
+        return BulkWriteResult(result, True)
+
+    # Reads
+    def find(self, filter: Optional[dict] = None, projection=None, sort=None, skip: int = 0,
+             limit: int = 0, batch_size: int = 0, **kwargs) -> MemoryCursor:
+        def loader(cursor_sort, cursor_skip, cursor_limit):
+            end = cursor_skip + cursor_limit if cursor_limit else None
+            walked = self._ordered_walk(filter, _normalize_keys(cursor_sort), end) if cursor_sort and end else None
+            if walked is not None:
+                docs = [doc for _, doc in walked]
+            else:
+                docs = [doc for _, doc in self._matching(filter)]
+                if cursor_sort:
+                    docs = sort_documents(docs, _normalize_keys(cursor_sort), end)
+            # Only the documents on the page are copied out
+            return [project(_clone(doc), projection) for doc in docs[cursor_skip:end]]
+
+        cursor = MemoryCursor(loader)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter: Optional[dict] = None, projection=None, *args, **kwargs) -> Optional[dict]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        found = self._first(filter, kwargs.get("sort"))
+        return project(_clone(found[1]), projection) if found else None
+
+    def aggregate(self, pipeline: List[dict], **kwargs) -> MemoryCursor:
+        def loader(cursor_sort, cursor_skip, cursor_limit):
+            docs = self._run_pipeline(pipeline)
+            if cursor_sort:
+                docs = sort_documents(docs, _normalize_keys(cursor_sort))
+            return docs[cursor_skip:cursor_skip + cursor_limit if cursor_limit else None]
+        return MemoryCursor(loader)
+
+    def _geo_near_stage(self, spec: dict) -> List[dict]:
+        field = spec.get("key") or (next(iter(self._geo_fields)) if len(self._geo_fields) == 1 else None)
+        if field not in self._geo_fields:
+            raise OperationFailure("$geoNear requires exactly one 2dsphere index or a key", 291)
+        origin = spec["near"]["coordinates"]
+        min_distance = spec.get("minDistance", 0)
+        max_distance = spec.get("maxDistance", math.inf)
+        results = []
+        for _, doc in self._matching(spec.get("query")):
+            location = _get_path(doc, field)
+            if not isinstance(location, dict) or location.get("type") != "Point":
+                continue
+            distance = haversine_meters(origin, location["coordinates"])
+            if min_distance <= distance <= max_distance:
+                results.append((distance, _clone(doc)))
+        results.sort(key=lambda item: item[0])
+        for distance, doc in results:
+            _set_path(doc, spec["distanceField"], distance)
+        return [doc for _, doc in results]
+
+    def _run_pipeline(self, pipeline: List[dict], docs: Optional[List[dict]] = None) -> List[dict]:
+        top_level = docs is None
+        if top_level:
+            # A leading $match can use the hash and text indexes
+            query = pipeline[0]["$match"] if pipeline and "$match" in pipeline[0] else None
+            text_scores = {}
+            docs = []
+            for oid, doc in self._matching(query, text_scores):
+                docs.append(_clone(doc))
+                if oid in text_scores:
+                    docs[-1][TEXT_SCORE_FIELD] = text_scores[oid]
+            if query is not None:
+                pipeline = pipeline[1:]
+            elif pipeline and "$geoNear" in pipeline[0]:
+                docs = self._geo_near_stage(pipeline[0]["$geoNear"])
+                pipeline = pipeline[1:]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [doc for doc in docs if match(doc, spec)]
+            elif name in ("$project", "$addFields"):
+                docs = [self._project_stage(doc, spec, name != "$project") for doc in docs]
+            elif name == "$unionWith":
+                other = self.database[spec] if isinstance(spec, str) else self.database[spec["coll"]]
+                docs = docs + other._run_pipeline(spec.get("pipeline", []) if isinstance(spec, dict) else [])
+            elif name == "$facet":
+                docs = [{key: self._run_pipeline(sub, [_clone(doc) for doc in docs]) for key, sub in spec.items()}]
+            elif name == "$count":
+                docs = [{spec: len(docs)}] if docs else []
+            elif name == "$group":
+                docs = self._group_stage(docs, spec)
+            elif name == "$bucket":
+                docs = self._bucket_stage(docs, spec)
+            elif name == "$sort":
+                docs = sort_documents(docs, _normalize_keys(spec))
+            elif name == "$limit":
+                docs = docs[:spec]
+            else:
+                raise OperationFailure(f"Unsupported aggregation stage {name} in the memory engine")
+        if top_level:
+            for doc in docs:
+                doc.pop(TEXT_SCORE_FIELD, None)
+        return docs
+
+    @staticmethod
+    def _project_stage(doc: dict, spec: dict, adding: bool) -> dict:
+        if not adding and all(value in (0, 1, True, False) for value in spec.values()):
+            return project(doc, spec)
+        result = dict(doc) if adding else ({"_id": doc.get("_id")} if spec.get("_id", 1) else {})
+        for field, expression in spec.items():
+            if field == "_id" and expression in (0, False):
+                result.pop("_id", None)
+            elif expression in (1, True) and not adding:
+                value = _get_path(doc, field)
+                if value is not _MISSING:
+                    _set_path(result, field, value)
+            elif not (field == "_id" and expression in (1, True)):
+                _set_path(result, field, evaluate(expression, doc))
+        return result
+
+    @classmethod
+    def _bucket_stage(cls, docs: List[dict], spec: dict) -> List[dict]:
+        boundaries = spec["boundaries"]
+        output = spec.get("output", {"count": {"$sum": 1}})
+
+        def bucket_of(doc):
+            value = evaluate(spec["groupBy"], doc)
+            for lower, upper in zip(boundaries, boundaries[1:]):
+                if _compare(value, lower) is not None and lower <= value < upper:
+                    return lower
+            if "default" not in spec:
+                raise OperationFailure("$bucket could not find a matching branch and no default is set", 40066)
+            return spec["default"]
+
+        keyed = [dict(doc, __bucket=bucket_of(doc)) for doc in docs]
+        groups = cls._group_stage(keyed, {"_id": "$__bucket", **output})
+        order = {boundary: index for index, boundary in enumerate(boundaries)}
+        return sorted(groups, key=lambda group: order.get(group["_id"], len(boundaries)))
+
+    @staticmethod
+    def _group_stage(docs: List[dict], spec: dict) -> List[dict]:
+        groups = {}
+        for doc in docs:
+            key = evaluate(spec["_id"], doc)
+            groups.setdefault(bson.encode({"k": key}), (key, []))[1].append(doc)
+        results = []
+        for key, members in groups.values():
+            result = {"_id": key}
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                (operator, expression), = accumulator.items()
+                result[field] = _accumulate(operator, [evaluate(expression, doc) for doc in members])
+            results.append(result)
+        return results
+
+
+class MemoryDatabase:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, command, *args, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        raise OperationFailure(f"Command {name} is not supported by the memory engine")
+
+
+class MemoryClient:
+    """Drop-in for AsyncIOMotorClient backed by process memory, with optional snapshots."""
+
+    def __init__(self, snapshot_dir: Optional[Path] = None):
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self._databases: Dict[str, MemoryDatabase] = {}
+        self.address = ("memory", 0)
+        if self.snapshot_dir and self.snapshot_dir.exists():
+            self.load_snapshot()
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    async def drop_database(self, name):
+        self._databases.pop(getattr(name, "name", name), None)
+
+    def close(self):
+        pass
+
+    def load_snapshot(self):
+        for path in self.snapshot_dir.glob("*/*.bson"):
+            collection = self[path.parent.name][path.stem]
+            with open(path, "rb") as f:
+                for doc in bson.decode_file_iter(f):
+                    collection._insert(doc)
+
+    async def snapshot(self):
+        """Write every collection to snapshot_dir/<database>/<collection>.bson."""
+        if not self.snapshot_dir:
+            return
+        # Encode on the loop so the snapshot is a consistent point in time, write off it
+        payloads = {
+            (db_name, name): b"".join(bson.encode(doc) for doc in collection._docs.values())
+            for db_name, database in self._databases.items()
+            for name, collection in database._collections.items()
+        }
+        await asyncio.get_running_loop().run_in_executor(None, self._write_snapshot, payloads)
+
+    def _write_snapshot(self, payloads: dict):
+        for (db_name, name), payload in payloads.items():
+            directory = self.snapshot_dir / db_name
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = directory / f"{name}.bson.tmp"
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, directory / f"{name}.bson")
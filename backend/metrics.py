@@ -0,0 +1,272 @@
+"""Prometheus metrics for the API: HTTP routes, Mongo commands, connection pools and the event loop.
+
+server.py wires these in: MetricsMiddleware wraps the app, the listeners are
+passed to AsyncIOMotorClient(event_listeners=...), monitor_event_loop() runs as
+a startup task, track_password_hasher() publishes the bcrypt queue and /metrics
+serves render(). Label children are cached per key
+so the hot path is a dict lookup plus one histogram observe.
+
+With several worker processes, serve.py sets PROMETHEUS_MULTIPROC_DIR before
+the workers start. Every worker then writes its samples to files there, and
+whichever worker answers a scrape reports the sum over all of them. Gauges
+declare how they combine across workers.
+"""
+import asyncio
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# Without a scrape per worker, each worker restarts its worst-lag window on this schedule instead
+LAG_MAX_WINDOW_SECONDS = 60.0
+
+# Driver housekeeping that is not part of any request's work
+IGNORED_COMMANDS = {"endSessions", "hello", "isMaster", "ismaster", "ping", "saslStart", "saslContinue"}
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status code", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ["method", "route"]
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled", multiprocess_mode="livesum"
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ["collection", "command"],
+    buckets=MONGO_BUCKETS,
+)
+MONGO_DOCUMENTS = Counter(
+    "mongodb_command_documents_total", "Documents returned or written by MongoDB commands",
+    ["collection", "command"],
+)
+MONGO_FAILURES = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ["collection", "command"]
+)
+POOL_CONNECTIONS = Gauge(
+    "mongodb_pool_connections", "Open connections in the driver pool", ["address"], multiprocess_mode="livesum"
+)
+POOL_CHECKED_OUT = Gauge(
+    "mongodb_pool_checked_out", "Connections currently checked out", ["address"], multiprocess_mode="livesum"
+)
+POOL_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures_total", "Connection checkouts that failed or timed out", ["reason"]
+)
+EVENT_LOOP_LAG = Gauge(
+    "event_loop_lag_seconds", "How late the last event loop tick ran", multiprocess_mode="livemax"
+)
+EVENT_LOOP_LAG_MAX = Gauge(
+    "event_loop_lag_max_seconds", "Worst event loop lag since the last scrape", multiprocess_mode="livemax"
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth", "bcrypt calls waiting for a free password hashing worker",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight", "bcrypt calls currently running", multiprocess_mode="livesum"
+)
+
+
+class _Children:
+    """labels() takes a lock and hashes every call; keep one child per label tuple instead."""
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.children = {}
+
+    def get(self, *labels):
+        child = self.children.get(labels)
+        if child is None:
+            child = self.children[labels] = self.metric.labels(*labels)
+        return child
+
+
+_http_requests = _Children(HTTP_REQUESTS)
+_http_latency = _Children(HTTP_LATENCY)
+_mongo_latency = _Children(MONGO_LATENCY)
+_mongo_documents = _Children(MONGO_DOCUMENTS)
+_mongo_failures = _Children(MONGO_FAILURES)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses pass through untouched.
+
+    Requests are labelled by route template ("/api/produce/{produce_id}") rather
+    than path, which keeps the label set bounded.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_PROGRESS.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            _http_latency.get(method, template).observe(elapsed)
+            _http_requests.get(method, template, str(status_code)).inc()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Per-collection/per-command latency and document counts from the driver."""
+
+    def __init__(self):
+        self.collections = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        else:
+            collection = command.get(event.command_name)
+        self.collections[event.request_id] = collection if isinstance(collection, str) else "-"
+
+    def succeeded(self, event):
+        collection = self.collections.pop(event.request_id, None)
+        if collection is None:
+            return
+        _mongo_latency.get(collection, event.command_name).observe(event.duration_micros / 1e6)
+        documents = self._document_count(event.reply)
+        if documents:
+            _mongo_documents.get(collection, event.command_name).inc(documents)
+
+    def failed(self, event):
+        collection = self.collections.pop(event.request_id, None)
+        if collection is None:
+            return
+        _mongo_latency.get(collection, event.command_name).observe(event.duration_micros / 1e6)
+        _mongo_failures.get(collection, event.command_name).inc()
+
+    @staticmethod
+    def _document_count(reply) -> int:
+        cursor = reply.get("cursor")
+        if cursor is not None:
+            batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+            return len(batch) if batch is not None else 0
+        n = reply.get("n")
+        return n if isinstance(n, int) else 0
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Open and checked-out connection gauges per server address."""
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).set(0)
+        POOL_CHECKED_OUT.labels(self._address(event)).set(0)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).set(0)
+        POOL_CHECKED_OUT.labels(self._address(event)).set(0)
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.labels(self._address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUT_FAILURES.labels(str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        POOL_CHECKED_OUT.labels(self._address(event)).inc()
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.labels(self._address(event)).dec()
+
+
+def event_listeners() -> list:
+    return [CommandMetrics(), PoolMetrics()]
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Sleep for interval and record how much later than that the loop woke us."""
+    loop = asyncio.get_running_loop()
+    window_started = loop.time()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        EVENT_LOOP_LAG.set(lag)
+        if MULTIPROCESS_DIR and loop.time() - window_started >= LAG_MAX_WINDOW_SECONDS:
+            window_started = loop.time()
+            _reset_worst_lag()
+        if lag > _worst_lag[0]:
+            _worst_lag[0] = lag
+            EVENT_LOOP_LAG_MAX.set(lag)
+
+
+_worst_lag = [0.0]
+
+
+def _reset_worst_lag():
+    _worst_lag[0] = 0.0
+    EVENT_LOOP_LAG_MAX.set(0.0)
+
+
+def track_password_hasher(hasher):
+    """Mirror the hasher's queue into gauges on every change, so other workers can report it too."""
+    def publish():
+        PASSWORD_HASH_QUEUE_DEPTH.set(hasher.queue_depth)
+        PASSWORD_HASH_IN_FLIGHT.set(hasher.in_flight)
+    hasher.on_change = publish
+    publish()
+
+
+def render() -> tuple:
+    """Body and content type for a scrape; resets the worst-lag gauge."""
+    if MULTIPROCESS_DIR:
+        # Summed from every worker's files; the worst-lag windows are reset by time instead
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    body = generate_latest()
+    _reset_worst_lag()
+    return body, CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the shared files when it exits."""
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,134 @@
+"""Production entry point: the API in several uvicorn worker processes.
+
+Run from the backend directory with the same .env as the server:
+
+    python serve.py --workers 4 --port 8001
+
+Workers are separate processes, each importing server.py and opening its own
+MongoDB client and pool at startup (MONGO_MAX_POOL_SIZE and friends apply per
+worker). Settings that only hold within one process are checked before any
+worker starts: with several workers an unset RESPONSE_CACHE_BACKEND or
+ORDER_EVENTS_SOURCE becomes mongo or change_stream, and setting either to its
+per-process value explicitly is an error. With more than one worker, Prometheus
+metrics are shared through files in PROMETHEUS_MULTIPROC_DIR (a temporary
+directory unless set), so any worker can answer a /metrics scrape for all of them.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger("serve")
+
+
+def default_workers() -> int:
+    return int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+
+# Settings whose defaults only hold within one process, and what several workers use instead
+SHARED_DEFAULTS = {
+    'RESPONSE_CACHE_BACKEND': "mongo",
+    'ORDER_EVENTS_SOURCE': "change_stream",
+}
+
+
+def apply_shared_defaults(workers: int):
+    """With several workers, switch unset per-process settings to their shared counterparts."""
+    if workers <= 1 or os.environ.get('STORAGE_ENGINE', 'mongo') == "memory":
+        return
+    for name, shared in SHARED_DEFAULTS.items():
+        if name not in os.environ:
+            # Workers inherit the environment, so server.py reads these values
+            os.environ[name] = shared
+            logger.info("%s=%s for %d workers", name, shared, workers)
+
+
+def check_settings(workers: int) -> list:
+    """Problems with running this many workers: (fatal, message) pairs."""
+    problems = []
+    if os.environ.get('STORAGE_ENGINE', 'mongo') == "memory":
+        if workers > 1:
+            problems.append((True, "STORAGE_ENGINE=memory keeps data in one process; run a single worker"))
+        return problems
+    if workers > 1:
+        if os.environ.get('RESPONSE_CACHE_BACKEND', 'memory') == "memory":
+            problems.append((True, "RESPONSE_CACHE_BACKEND=memory is per worker, so catalog writes only "
+                                   "invalidate the worker that made them; use mongo or off"))
+        if os.environ.get('ORDER_EVENTS_SOURCE', 'local') == "local":
+            problems.append((True, "ORDER_EVENTS_SOURCE=local only streams events from the same worker; "
+                                   "use change_stream"))
+        if os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread') == "process":
+            problems.append((False, "PASSWORD_HASH_EXECUTOR=process starts a hashing pool in every worker"))
+    max_pool = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+    logger.info("Up to %d MongoDB connections (%d workers x MONGO_MAX_POOL_SIZE %d)",
+                workers * max_pool, workers, max_pool)
+    return problems
+
+
+def prepare_metrics_dir(workers: int) -> bool:
+    """Point the workers at a clean PROMETHEUS_MULTIPROC_DIR; True if this process created it."""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        # Files from an earlier run would be added to this run's counters
+        Path(path).mkdir(parents=True, exist_ok=True)
+        for stale in Path(path).glob("*.db"):
+            stale.unlink()
+        return False
+    if workers > 1 and os.environ.get('METRICS_ENABLED', 'true').lower() == 'true':
+        # Workers inherit the environment, so they pick this up when they import prometheus_client
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix="farmer-web-metrics-")
+        return True
+    return False
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the marketplace API with several worker processes")
+    parser.add_argument("--host", default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('PORT', 8001)))
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="Worker processes (default WEB_CONCURRENCY or the CPU count)")
+    parser.add_argument("--backlog", type=int, default=2048, help="Listen socket backlog")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5, help="Seconds to hold idle connections")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", action="store_true", help="Skip per-request access log lines")
+    args = parser.parse_args()
+
+    apply_shared_defaults(args.workers)
+    problems = check_settings(args.workers)
+    for fatal, message in problems:
+        (logger.error if fatal else logger.warning)(message)
+    if any(fatal for fatal, _ in problems):
+        return 1
+
+    created_metrics_dir = prepare_metrics_dir(args.workers)
+    # With workers > 1 uvicorn needs an import string; each worker imports it afresh
+    try:
+        uvicorn.run(
+            "server:app",
+            app_dir=str(ROOT_DIR),
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            backlog=args.backlog,
+            timeout_keep_alive=args.timeout_keep_alive,
+            log_level=args.log_level,
+            access_log=not args.no_access_log,
+            proxy_headers=True,
+        )
+    finally:
+        if created_metrics_dir:
+            shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,120 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, Header, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from gridfs.errors import FileExists, NoFile
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Optional, Union
 import uuid
 from datetime import datetime, timedelta
 import bcrypt
 import jwt
 from enum import Enum
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import base64
+import json
+import orjson
+import csv
+import itertools
+import time
+import asyncio
+import multiprocessing
+import tempfile
+import hashlib
+import hmac
+import io
+import re
+from PIL import Image, UnidentifiedImageError
+
+import diagnostics
+import jobs
+import metrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage Engine Configuration
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'mongo')  # mongo or memory
+MEMORY_SNAPSHOT_PATH = os.environ.get('MEMORY_SNAPSHOT_PATH')  # unset keeps the memory engine volatile
+MEMORY_SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get('MEMORY_SNAPSHOT_INTERVAL_SECONDS', 60))
+
+# MongoDB Pool Configuration (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))  # also how many connections to warm
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 0))  # 0 waits indefinitely
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_CHECK_TIMEOUT_SECONDS', 2))
+
+# Metrics Configuration
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get('EVENT_LOOP_LAG_INTERVAL_SECONDS', 0.5))
+
+# Diagnostics Configuration
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))  # 0 disables the slow-query log
+DEBUG_TOKEN = os.environ.get('DEBUG_TOKEN')  # unset disables profiling and the /debug routes
+# Reports are throwaway, so they stay out of the source tree by default
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', Path(tempfile.gettempdir()) / 'farmer-web-profiles'))
+slow_query_log = diagnostics.SlowQueryLog()
+
+def driver_listeners() -> list:
+    listeners = metrics.event_listeners() if METRICS_ENABLED else []
+    if SLOW_QUERY_MS > 0:
+        listeners.append(diagnostics.SlowQueryListener(SLOW_QUERY_MS, slow_query_log.pending))
+    return listeners
+
+def mongo_client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    return options
+
+# MongoDB connection, opened by connect_database() in the process that uses it: at startup
+# in each uvicorn worker, or by manage.py. A client created at import time would be shared
+# by forked workers, whose pool sockets and monitor threads do not survive the fork.
+client = None
+db = None
+_database_ready = False  # set once the pool is warm; gates /api/health/ready
+
+def connect_database():
+    global client, db
+    if client is None:
+        if STORAGE_ENGINE == "memory":
+            from memory_engine import MemoryClient
+            client = MemoryClient(Path(MEMORY_SNAPSHOT_PATH) if MEMORY_SNAPSHOT_PATH else None)
+        else:
+            client = AsyncIOMotorClient(
+                os.environ['MONGO_URL'], event_listeners=driver_listeners(), **mongo_client_options()
+            )
+        db = client[os.environ['DB_NAME']]
+    return db
+
+async def warm_connection_pool():
+    # minPoolSize is only topped up by a background thread; open the connections now so the
+    # first requests after a deploy do not each pay for a TCP + TLS + auth handshake
+    started = time.perf_counter()
+    await db.command("ping")
+    if STORAGE_ENGINE != "memory" and MONGO_MIN_POOL_SIZE > 1:
+        await asyncio.gather(*(db.command("ping") for _ in range(MONGO_MIN_POOL_SIZE)))
+    logger.info("Connection pool warmed in %.1f ms", (time.perf_counter() - started) * 1000)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -33,8 +126,90 @@ api_router = APIRouter(prefix="/api")
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-here')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Tokens for GET /orders/events travel in the URL (EventSource cannot set headers) and end up in
+# access logs, so they are scoped to the stream and short-lived
+STREAM_TOKEN_SCOPE = "order_events"
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+
+# Checkout Configuration
+MAX_CHECKOUT_ITEMS = int(os.environ.get('MAX_CHECKOUT_ITEMS', 100))
+# Hold tags older than this were left by a checkout that died mid-way and are swept
+CHECKOUT_HOLD_TTL_SECONDS = 300
+
+# Bulk Import Configuration
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+MAX_IMPORT_ERRORS = 1000
+
+# Export Configuration
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+EXPORT_CHUNK_ROWS = 500
+ORDER_EXPORT_FIELDS = [
+    "id", "produce_id", "produce_title", "farmer_id", "farmer_name", "buyer_id", "buyer_name",
+    "quantity", "unit_price", "total_amount", "status", "payment_reference", "created_at", "updated_at"
+]
+PRODUCE_EXPORT_FIELDS = [
+    "id", "unique_code", "title", "category", "description", "price", "quantity", "unit",
+    "region", "is_available", "created_at"
+]
+
+# Price Rollup Configuration
+ROLLUP_BUCKET_SIZES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+ROLLUP_DEFAULT_RANGES = {"hour": timedelta(days=7), "day": timedelta(days=180)}
+MAX_ROLLUP_POINTS = 2000
+
+# Geospatial Configuration
+NEAR_DEFAULT_RADIUS_KM = 50
+NEAR_MAX_RADIUS_KM = 500
+
+# Search Configuration
+MAX_SEARCH_TERMS = 10
+# Lower bounds of the price histogram buckets; prices from the last bound up share one bucket
+PRICE_HISTOGRAM_BOUNDARIES = [0, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+# Pagination Configuration
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Password Hashing Configuration
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')  # thread or process
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+
+# Auth Cache Configuration
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+# Response Cache Configuration
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  # memory, mongo or off
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 5000))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 300))
+# mongo backend: how long a worker trusts its copy of the catalog version, i.e. how stale
+# another worker's write can look here
+RESPONSE_CACHE_VERSION_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_VERSION_TTL_SECONDS', 1))
+
+# Image Storage Configuration
+IMAGE_STORE = os.environ.get('IMAGE_STORE', 'gridfs')  # gridfs or local
+IMAGE_STORE_PATH = Path(os.environ.get('IMAGE_STORE_PATH', ROOT_DIR / 'images'))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', 5 * 1024 * 1024))
+THUMBNAIL_SIZE = (320, 320)
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Job Queue Configuration
+JOBS_MODE = os.environ.get('JOBS_MODE', 'in_process')  # in_process, or external for `python -m worker`
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', 8))
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get('JOB_POLL_INTERVAL_SECONDS', 1))
+JOB_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 7 * 86400))  # finished jobs
+JOB_PURGE_INTERVAL_SECONDS = 300  # memory engine only, which has no TTL expiry
+NOTIFICATION_PAGE_SIZE = 50
+
+# Order Events Configuration
+ORDER_EVENTS_SOURCE = os.environ.get('ORDER_EVENTS_SOURCE', 'local')  # local or change_stream
+ORDER_EVENTS_QUEUE_SIZE = int(os.environ.get('ORDER_EVENTS_QUEUE_SIZE', 100))
+ORDER_EVENTS_KEEPALIVE_SECONDS = float(os.environ.get('ORDER_EVENTS_KEEPALIVE_SECONDS', 15))
 
 # Enums
 class UserRole(str, Enum):
@@ -60,7 +235,13 @@ class OrderStatus(str, Enum):
     DELIVERED = "delivered"
     CANCELLED = "cancelled"
 
+CANCELLABLE_STATUSES = [OrderStatus.PENDING, OrderStatus.CONFIRMED]
+
 # Models
+class GeoPoint(BaseModel):
+    type: str = "Point"
+    coordinates: List[float]  # GeoJSON order: [longitude, latitude]
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: str
@@ -69,6 +250,7 @@ class User(BaseModel):
     role: UserRole
     phone: str
     region: Region
+    location: Optional[GeoPoint] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
 
@@ -79,6 +261,8 @@ class UserCreate(BaseModel):
     role: UserRole
     phone: str
     region: Region
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class UserLogin(BaseModel):
     email: str
@@ -91,6 +275,7 @@ class UserResponse(BaseModel):
     role: UserRole
     phone: str
     region: Region
+    location: Optional[GeoPoint] = None
     created_at: datetime
     is_active: bool
 
@@ -105,7 +290,8 @@ class Produce(BaseModel):
     quantity: int
     unit: str  # kg, bags, pieces, etc.
     region: Region
-    image_data: Optional[str] = None  # base64 encoded image
+    location: Optional[GeoPoint] = None  # defaults to the farmer's location
+    image_id: Optional[str] = None  # content hash in the image store
     unique_code: str = Field(default_factory=lambda: str(uuid.uuid4())[:8].upper())
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_available: bool = True
@@ -117,7 +303,28 @@ class ProduceCreate(BaseModel):
     price: float
     quantity: int
     unit: str
-    image_data: Optional[str] = None
+    image_id: Optional[str] = None
+    image_data: Optional[str] = None  # legacy inline base64, moved to the image store on write
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class DataFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+class ImportRowError(BaseModel):
+    row: int
+    detail: str
+
+class ImportReport(BaseModel):
+    imported: int = 0
+    rejected: int = 0
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+    resume_from: Optional[int] = None  # first row not imported after a failed batch
+
+class ImageUploadResponse(BaseModel):
+    image_id: str
 
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -127,6 +334,9 @@ class Order(BaseModel):
     buyer_name: str
     farmer_name: str
     produce_title: str
+    # The listing's category and region when ordered, so price rollups back out of the right series
+    category: Optional[str] = None
+    region: Optional[str] = None
     quantity: int
     unit_price: float
     total_amount: float
@@ -139,7 +349,255 @@ class OrderCreate(BaseModel):
     produce_id: str
     quantity: int
 
+class Notification(BaseModel):
+    id: str
+    user_id: str
+    type: str
+    message: str
+    order_id: Optional[str] = None
+    read: bool = False
+    created_at: datetime
+
+class CheckoutMode(str, Enum):
+    ATOMIC = "atomic"
+    PARTIAL = "partial"
+
+class CheckoutRequest(BaseModel):
+    items: List[OrderCreate]
+    mode: CheckoutMode = CheckoutMode.ATOMIC
+
+class CheckoutFailure(BaseModel):
+    produce_id: str
+    detail: str
+
+class CheckoutResponse(BaseModel):
+    orders: List[Order]
+    failures: List[CheckoutFailure]
+
+class NearbyProduce(Produce):
+    distance_km: float
+
+class ProducePage(BaseModel):
+    items: List[Union[NearbyProduce, Produce]]
+    next_cursor: Optional[str] = None
+
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+class PriceFacet(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    count: int = 0
+    histogram: List[PriceBucket] = []
+
+class ProduceFacets(BaseModel):
+    categories: Dict[str, int]
+    regions: Dict[str, int]
+    prices: Dict[str, PriceFacet]
+
+class RollupGranularity(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+class PricePoint(BaseModel):
+    bucket: datetime
+    vwap: float
+    min_price: float
+    max_price: float
+    volume: int
+    orders: int
+
+class PriceSeries(BaseModel):
+    category: ProduceCategory
+    region: Optional[Region] = None
+    granularity: RollupGranularity
+    points: List[PricePoint]
+
+# Projections for the list fast path: exactly the response fields, never _id
+PRODUCE_PROJECTION = {"_id": 0, **{field: 1 for field in Produce.model_fields}}
+ORDER_PROJECTION = {"_id": 0, **{field: 1 for field in Order.model_fields}}
+PRODUCE_DEFAULTS = {"image_id": None, "location": None}
+ORDER_DEFAULTS = {"payment_reference": None, "category": None, "region": None}
+
+def trusted_documents(docs: List[dict], defaults: dict) -> List[dict]:
+    """Documents written through the models are returned as-is instead of being re-validated."""
+    for doc in docs:
+        for field, value in defaults.items():
+            doc.setdefault(field, value)
+    return docs
+
 # Helper functions
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a time-to-live."""
+    
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+    
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self.ttl
+        if ttl is None or ttl <= 0 or self.max_size <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def invalidate(self, key):
+        self._data.pop(key, None)
+    
+    def clear(self):
+        self._data.clear()
+    
+    def stats(self) -> dict:
+        return {"size": len(self._data), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(TOKEN_CACHE_SIZE)
+
+class MemoryCacheBackend:
+    """Per-process cache; versions are not shared, so use it with a single worker."""
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.entries = TTLCache(max_size, ttl)
+        self.versions = {}
+    
+    async def get_version(self, namespace: str) -> int:
+        return self.versions.get(namespace, 0)
+    
+    async def bump_version(self, namespace: str):
+        self.versions[namespace] = self.versions.get(namespace, 0) + 1
+    
+    async def get(self, key: str) -> Optional[tuple]:
+        return self.entries.get(key)
+    
+    async def set(self, key: str, value: tuple):
+        self.entries.set(key, value)
+    
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+class MongoCacheBackend:
+    """Cache shared by every worker through the cache_versions and response_cache collections.
+    
+    Each worker trusts its copy of a version for version_ttl seconds and keeps the entries it has
+    seen in a local LRU (keys include the version, so they never change), so a warm hit costs no
+    round trip. Writes from other workers show up within version_ttl.
+    """
+    
+    def __init__(self, database, ttl: float, version_ttl: float, local_size: int):
+        self.versions = database.cache_versions
+        self.entries = database.response_cache
+        self.ttl = ttl
+        self.local_versions = TTLCache(1000, version_ttl)
+        self.local_entries = TTLCache(local_size, ttl)
+        self.hits = 0
+        self.misses = 0
+    
+    async def get_version(self, namespace: str) -> int:
+        version = self.local_versions.get(namespace)
+        if version is None:
+            doc = await self.versions.find_one({"_id": namespace})
+            version = doc["version"] if doc else 0
+            self.local_versions.set(namespace, version)
+        return version
+    
+    async def bump_version(self, namespace: str):
+        doc = await self.versions.find_one_and_update(
+            {"_id": namespace}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        # This worker sees its own writes immediately
+        self.local_versions.set(namespace, doc["version"])
+    
+    async def get(self, key: str) -> Optional[tuple]:
+        entry = self.local_entries.get(key)
+        if entry is None:
+            doc = await self.entries.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            if doc is None:
+                self.misses += 1
+                return None
+            entry = (doc["etag"], doc["body"])
+            self.local_entries.set(key, entry)
+        self.hits += 1
+        return entry
+    
+    async def set(self, key: str, value: tuple):
+        etag, body = value
+        self.local_entries.set(key, value)
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        await self.entries.replace_one(
+            {"_id": key}, {"_id": key, "etag": etag, "body": body, "expires_at": expires_at}, upsert=True
+        )
+    
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "local": self.local_entries.stats()}
+
+_response_cache = None
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None and RESPONSE_CACHE_BACKEND != "off":
+        if RESPONSE_CACHE_BACKEND == "mongo":
+            _response_cache = MongoCacheBackend(
+                db, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_VERSION_TTL_SECONDS, RESPONSE_CACHE_SIZE
+            )
+        else:
+            _response_cache = MemoryCacheBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS)
+    return _response_cache
+
+async def bump_catalog_version():
+    # Any produce or stock write invalidates every cached catalog response
+    cache = get_response_cache()
+    if cache is not None:
+        await cache.bump_version("produce")
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+async def cached_json_response(request: Request, name: str, params: dict, build) -> Response:
+    """Serve a catalog read from the response cache, honouring If-None-Match."""
+    cache = get_response_cache()
+    entry = None
+    if cache is not None:
+        version = await cache.get_version("produce")
+        normalized = sorted((k, str(v)) for k, v in params.items() if v is not None)
+        key = f"{name}:v{version}:{json.dumps(normalized)}"
+        entry = await cache.get(key)
+    
+    if entry is None:
+        body = orjson.dumps(await build())
+        entry = (f'"{hashlib.sha256(body).hexdigest()}"', body)
+        if cache is not None:
+            await cache.set(key, entry)
+    
+    etag, body = entry
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+def invalidate_user(user_id: str):
+    # Call after every write to a user document (role, is_active, password, ...) made by this process
+    user_cache.invalidate(user_id)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -150,30 +608,311 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def encode_cursor(doc: dict) -> str:
+    payload = {"c": doc["created_at"].isoformat(), "i": doc["id"]}
+    if "score" in doc:
+        payload["s"] = doc["score"]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+        score = float(payload["s"]) if "s" in payload else None
+        return datetime.fromisoformat(payload["c"]), str(payload["i"]), score
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+async def fetch_produce_page(query: dict, after: Optional[str], limit: int) -> dict:
+    # Keyset pagination over (created_at, id), newest first
+    if after:
+        created_at, last_id, _ = decode_cursor(after)
+        keyset = {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": last_id}}
+        ]}
+        query = {"$and": [query, keyset]}
+    
+    cursor = db.produce.find(query, PRODUCE_PROJECTION).sort([("created_at", -1), ("id", -1)]).limit(limit + 1)
+    produce_list = await cursor.to_list(limit + 1)
+    
+    next_cursor = None
+    if len(produce_list) > limit:
+        produce_list = produce_list[:limit]
+        next_cursor = encode_cursor(produce_list[-1])
+    
+    return {"items": trusted_documents(produce_list, PRODUCE_DEFAULTS), "next_cursor": next_cursor}
+
+def encode_near_cursor(distance: float, seen_ids: List[str]) -> str:
+    payload = {"d": distance, "x": seen_ids}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('utf-8')
+
+def decode_near_cursor(cursor: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+        return float(payload["d"]), [str(item) for item in payload["x"]]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+async def fetch_nearby_produce_page(
+    query: dict, latitude: float, longitude: float, radius_km: float, after: Optional[str], limit: int
+) -> dict:
+    # Nearest first via the 2dsphere index. The cursor resumes at the last distance and
+    # carries the ids already served at exactly that distance, so ties are not repeated.
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [longitude, latitude]},
+        "key": "location",
+        "distanceField": "distance",
+        "maxDistance": radius_km * 1000,
+        "query": query,
+        "spherical": True,
+    }
+    pipeline = [{"$geoNear": geo_near}]
+    last_distance, seen_ids = None, []
+    if after:
+        last_distance, seen_ids = decode_near_cursor(after)
+        geo_near["minDistance"] = last_distance
+        if seen_ids:
+            pipeline.append({"$match": {"id": {"$nin": seen_ids}}})
+    pipeline += [
+        {"$limit": limit + 1},
+        {"$project": {**PRODUCE_PROJECTION, "distance": 1}},
+    ]
+    produce_list = await db.produce.aggregate(pipeline).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(produce_list) > limit:
+        produce_list = produce_list[:limit]
+        boundary = produce_list[-1]["distance"]
+        tied_ids = [produce["id"] for produce in produce_list if produce["distance"] == boundary]
+        if boundary == last_distance:
+            tied_ids += seen_ids
+        next_cursor = encode_near_cursor(boundary, tied_ids)
+    for produce in produce_list:
+        produce["distance_km"] = round(produce.pop("distance") / 1000, 3)
+    
+    return {"items": trusted_documents(produce_list, PRODUCE_DEFAULTS), "next_cursor": next_cursor}
+
+def search_terms(search: Optional[str]) -> Optional[str]:
+    # Plain words only: quotes and leading hyphens are phrase and negation operators to $text
+    words = re.findall(r"\w+", search.lower())[:MAX_SEARCH_TERMS] if search else []
+    return " ".join(words) or None
+
+async def search_produce_page(query: dict, terms: str, after: Optional[str], limit: int) -> dict:
+    # Ranked by textScore, then newest first; the cursor carries the score as the leading key
+    pipeline = [
+        {"$match": {"$text": {"$search": terms}, **query}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if after:
+        created_at, last_id, score = decode_cursor(after)
+        if score is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "created_at": {"$lt": created_at}},
+            {"score": score, "created_at": created_at, "id": {"$lt": last_id}}
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "created_at": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {**PRODUCE_PROJECTION, "score": 1}},
+    ]
+    produce_list = await db.produce.aggregate(pipeline).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(produce_list) > limit:
+        produce_list = produce_list[:limit]
+        next_cursor = encode_cursor(produce_list[-1])
+    for produce in produce_list:
+        del produce["score"]
+    
+    return {"items": trusted_documents(produce_list, PRODUCE_DEFAULTS), "next_cursor": next_cursor}
+
+async def compute_produce_facets(query: dict, category: Optional[str], region: Optional[str]) -> dict:
+    # Each facet ignores its own filter, so the sidebar shows what picking another value would give
+    category_filter = {"category": category} if category else {}
+    region_filter = {"region": region} if region else {}
+    facets = {
+        "categories": [{"$match": region_filter}, {"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+        "regions": [{"$match": category_filter}, {"$group": {"_id": "$region", "count": {"$sum": 1}}}],
+        "prices": [
+            {"$match": {**category_filter, **region_filter}},
+            {"$group": {"_id": "$category", "min": {"$min": "$price"}, "max": {"$max": "$price"},
+                        "count": {"$sum": 1}}},
+        ],
+    }
+    # Prices at or above the last bound fall into $bucket's default, labelled with that bound
+    upper_bound = PRICE_HISTOGRAM_BOUNDARIES[-1]
+    for produce_category in ProduceCategory:
+        if category and produce_category != category:
+            continue
+        facets[f"histogram:{produce_category.value}"] = [
+            {"$match": {**region_filter, "category": produce_category.value}},
+            {"$bucket": {
+                "groupBy": "$price",
+                "boundaries": PRICE_HISTOGRAM_BOUNDARIES,
+                "default": upper_bound,
+                "output": {"count": {"$sum": 1}},
+            }},
+        ]
+    pipeline = [
+        {"$match": query},
+        {"$project": {"_id": 0, "category": 1, "region": 1, "price": 1}},
+        {"$facet": facets},
+    ]
+    result = (await db.produce.aggregate(pipeline).to_list(1))[0]
+    
+    prices = {}
+    for group in result["prices"]:
+        prices[group["_id"]] = {"min": group["min"], "max": group["max"], "count": group["count"], "histogram": []}
+    for key, buckets in result.items():
+        if not key.startswith("histogram:") or not buckets:
+            continue
+        facet = prices.setdefault(key.split(":", 1)[1], {"min": None, "max": None, "count": 0, "histogram": []})
+        bounds = dict(zip(PRICE_HISTOGRAM_BOUNDARIES, PRICE_HISTOGRAM_BOUNDARIES[1:] + [None]))
+        facet["histogram"] = [
+            {"min": bucket["_id"], "max": bounds.get(bucket["_id"]), "count": bucket["count"]}
+            for bucket in buckets
+        ]
+    
+    return {
+        "categories": {c.value: 0 for c in ProduceCategory} | {g["_id"]: g["count"] for g in result["categories"]},
+        "regions": {r.value: 0 for r in Region} | {g["_id"]: g["count"] for g in result["regions"]},
+        "prices": prices,
+    }
+
+def _hashpw(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
 
-def verify_password(password: str, hashed_password: str) -> bool:
+def _checkpw(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+class PasswordHasher:
+    """Runs bcrypt on a bounded executor so it never blocks the event loop."""
+    
+    def __init__(self, workers: int, kind: str = "thread", rounds: int = 12):
+        self.workers = workers
+        self.kind = kind
+        self.rounds = rounds
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.on_change = None  # called whenever queue_depth or in_flight changes
+        self._executor = None
+        self._semaphore = None
+    
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # Forking would copy a process that already runs Motor's threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._executor
+    
+    async def _run(self, fn, *args):
+        executor = self._get_executor()
+        self.queue_depth += 1
+        self._changed()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+            self._changed()
+        self.in_flight += 1
+        self._changed()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self._changed()
+    
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+    
+    async def hash(self, password: str) -> str:
+        return await self._run(_hashpw, password, self.rounds)
+    
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_checkpw, password, hashed_password)
+    
+    def needs_rehash(self, hashed_password: str) -> bool:
+        # bcrypt hashes look like $2b$<cost>$<salt+hash>
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+    
+    def stats(self) -> dict:
+        return {"workers": self.workers, "in_flight": self.in_flight, "queue_depth": self.queue_depth}
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_EXECUTOR, BCRYPT_ROUNDS)
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(password, hashed_password)
+
+def decode_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Memoize only until the token itself expires
+        if "exp" in payload:
+            token_cache.set(token, payload, ttl=payload["exp"] - time.time())
+    return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str, scope: Optional[str] = None) -> UserResponse:
+    # Scoped tokens (the event stream's) only work where that scope is asked for
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("scope") != scope:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        user = await db.users.find_one({"id": user_id})
-        if user is None:
+        user_response = user_cache.get(user_id)
+        if user_response is None:
+            user = await db.users.find_one({"id": user_id})
+            if user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="User not found",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            user_response = UserResponse(**user)
+            user_cache.set(user_id, user_response)
+        # Checked on cache hits too; a deactivation made outside the API shows up within the cache TTL
+        if not user_response.is_active:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-                headers={"WWW-Authenticate": "Bearer"},
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Account is disabled"
             )
-        return UserResponse(**user)
+        return user_response
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -181,6 +920,603 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+# Image Storage
+IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class LocalImageStore:
+    def __init__(self, root: Path):
+        self.root = root
+    
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+    
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A temp name per write, so concurrent uploads of the same image never share one;
+        # keys are content hashes, so whichever replace() lands last writes the same bytes
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+    
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        return path.read_bytes() if path.exists() else None
+    
+    async def put(self, key: str, data: bytes):
+        await run_in_threadpool(self._write, key, data)
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await run_in_threadpool(self._read, key)
+    
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self._path(key).exists)
+
+class GridFSImageStore:
+    def __init__(self, database):
+        self.bucket = AsyncIOMotorGridFSBucket(database, bucket_name="images")
+        self.files = database["images.files"]
+    
+    async def put(self, key: str, data: bytes):
+        if await self.exists(key):
+            return
+        try:
+            await self.bucket.upload_from_stream_with_id(key, key, data)
+        except FileExists:
+            # A concurrent upload of the same content got there first
+            pass
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            stream = await self.bucket.open_download_stream(key)
+        except NoFile:
+            return None
+        return await stream.read()
+    
+    async def exists(self, key: str) -> bool:
+        return await self.files.find_one({"_id": key}, {"_id": 1}) is not None
+
+_image_store = None
+
+def get_image_store():
+    global _image_store
+    if _image_store is None:
+        # GridFS needs a real server, so the memory engine always keeps images on disk
+        if IMAGE_STORE == "local" or STORAGE_ENGINE == "memory":
+            _image_store = LocalImageStore(IMAGE_STORE_PATH)
+        else:
+            _image_store = GridFSImageStore(db)
+    return _image_store
+
+def thumbnail_key(image_id: str) -> str:
+    return f"{image_id}.thumb"
+
+def sniff_image_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"GIF8"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+def make_thumbnail(data: bytes) -> bytes:
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(THUMBNAIL_SIZE)
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file is not a valid image"
+        )
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=80)
+    return output.getvalue()
+
+def check_image(data: bytes):
+    # Reads the header only; decoding and resizing happen in the thumbnail job
+    try:
+        Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file is not a valid image"
+        )
+
+async def store_image(data: bytes) -> str:
+    if len(data) > MAX_IMAGE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Image is too large"
+        )
+    check_image(data)
+    image_id = hashlib.sha256(data).hexdigest()
+    store = get_image_store()
+    if not await store.exists(image_id):
+        await store.put(image_id, data)
+        await enqueue_jobs(("image.thumbnail", {"image_id": image_id}))
+    return image_id
+
+def geo_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[dict]:
+    if latitude is None and longitude is None:
+        return None
+    if latitude is None or longitude is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="latitude and longitude must be given together"
+        )
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+async def produce_write_data(produce_data: ProduceCreate) -> dict:
+    # Produce documents only keep a reference to the stored image
+    data = produce_data.dict(exclude={"image_data", "latitude", "longitude"})
+    location = geo_point(produce_data.latitude, produce_data.longitude)
+    if location:
+        data["location"] = location
+    if produce_data.image_data:
+        try:
+            raw = base64.b64decode(produce_data.image_data, validate=True)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid base64 image data"
+            )
+        data["image_id"] = await store_image(raw)
+    elif data["image_id"] and not (
+        IMAGE_ID_PATTERN.match(data["image_id"]) and await get_image_store().exists(data["image_id"])
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Image not found"
+        )
+    return data
+
+# Dashboard Counters
+# Per-user counters in db.user_stats; only documents with reconciled_at are trusted
+STAT_FIELDS = ["total_produce", "active_produce", "total_orders", "pending_orders", "completed_orders"]
+DASHBOARD_FIELDS = {
+    UserRole.FARMER: ["total_produce", "active_produce", "total_orders", "pending_orders"],
+    UserRole.BUYER: ["total_orders", "pending_orders", "completed_orders"],
+}
+
+def order_status_deltas(old_status: Optional[str], new_status: Optional[str]) -> dict:
+    deltas = {}
+    for field, tracked in (("pending_orders", OrderStatus.PENDING), ("completed_orders", OrderStatus.DELIVERED)):
+        change = (new_status == tracked) - (old_status == tracked)
+        if change:
+            deltas[field] = change
+    return deltas
+
+async def increment_user_stats(user_ids: List[str], deltas: dict):
+    await bulk_increment_user_stats({user_id: deltas for user_id in user_ids})
+
+async def bulk_increment_user_stats(deltas_by_user: dict):
+    operations = [
+        UpdateOne({"user_id": user_id}, {"$inc": deltas}, upsert=True)
+        for user_id, deltas in deltas_by_user.items() if deltas
+    ]
+    if operations:
+        await db.user_stats.bulk_write(operations, ordered=False)
+
+def _facet_count(result: dict, field: str) -> int:
+    return result[field][0]["n"] if result.get(field) else 0
+
+async def aggregate_user_stats(user_id: str, role: UserRole) -> dict:
+    # One round trip per role, straight from the source collections
+    if role == UserRole.FARMER:
+        pipeline = [
+            {"$match": {"farmer_id": user_id}},
+            {"$project": {"_id": 0, "kind": "produce", "is_available": 1}},
+            {"$unionWith": {"coll": "orders", "pipeline": [
+                {"$match": {"farmer_id": user_id}},
+                {"$project": {"_id": 0, "kind": "order", "status": 1}},
+            ]}},
+            {"$facet": {
+                "total_produce": [{"$match": {"kind": "produce"}}, {"$count": "n"}],
+                "active_produce": [{"$match": {"kind": "produce", "is_available": True}}, {"$count": "n"}],
+                "total_orders": [{"$match": {"kind": "order"}}, {"$count": "n"}],
+                "pending_orders": [{"$match": {"kind": "order", "status": OrderStatus.PENDING}}, {"$count": "n"}],
+                "completed_orders": [{"$match": {"kind": "order", "status": OrderStatus.DELIVERED}}, {"$count": "n"}],
+            }},
+        ]
+        collection = db.produce
+    else:
+        pipeline = [
+            {"$match": {"buyer_id": user_id}},
+            {"$facet": {
+                "total_orders": [{"$count": "n"}],
+                "pending_orders": [{"$match": {"status": OrderStatus.PENDING}}, {"$count": "n"}],
+                "completed_orders": [{"$match": {"status": OrderStatus.DELIVERED}}, {"$count": "n"}],
+            }},
+        ]
+        collection = db.orders
+    
+    results = await collection.aggregate(pipeline).to_list(1)
+    result = results[0] if results else {}
+    stats = {field: _facet_count(result, field) for field in STAT_FIELDS}
+    return stats
+
+async def reconcile_user_stats(user_id: str, role: UserRole) -> dict:
+    stats = await aggregate_user_stats(user_id, role)
+    await db.user_stats.update_one(
+        {"user_id": user_id},
+        {"$set": {**stats, "reconciled_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return stats
+
+# Order Events
+class OrderEventBroker:
+    """In-process fan-out of order events to each user's open event streams."""
+
+    RESYNC = orjson.dumps({"type": "resync"})
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        # With a change stream feeding the broker, the routes must not publish as well
+        self.publish_from_routes = ORDER_EVENTS_SOURCE != "change_stream"
+    
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+    
+    def publish(self, event: dict, user_ids: List[str]):
+        payload = None
+        for user_id in set(user_ids):
+            for queue in self.subscribers.get(user_id, ()):
+                if payload is None:
+                    payload = orjson.dumps(event)
+                try:
+                    queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    # A stalled client loses its backlog and is told to refetch instead
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(self.RESYNC)
+
+order_events = OrderEventBroker(ORDER_EVENTS_QUEUE_SIZE)
+
+def publish_order_event(event_type: str, order: dict, stats: Optional[dict] = None):
+    """Send an order event to its buyer and farmer; stats are the counter deltas for both."""
+    if order_events.publish_from_routes:
+        order_events.publish(
+            {"type": event_type, "order": order, "stats": stats},
+            [order["buyer_id"], order["farmer_id"]]
+        )
+
+async def watch_order_changes():
+    """Feed the broker from a change stream, so writes from every worker reach every stream."""
+    resume_token = None
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+    while True:
+        try:
+            async with db.orders.watch(
+                pipeline, full_document="updateLookup", resume_after=resume_token
+            ) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    order = change.get("fullDocument")
+                    if order is None:
+                        continue
+                    order.pop("_id", None)
+                    if change["operationType"] == "insert":
+                        event = {"type": "order.created", "order": order,
+                                 "stats": {"total_orders": 1, **order_status_deltas(None, order["status"])}}
+                    else:
+                        # The previous status is not in the event, so clients refetch their stats
+                        event = {"type": "order.updated", "order": order, "stats": None}
+                    order_events.publish(event, [order["buyer_id"], order["farmer_id"]])
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code in (40573, 40324):  # change streams need a replica set or sharded cluster
+                logger.error("Change streams unavailable (%s); publishing order events from routes", e)
+                order_events.publish_from_routes = True
+                return
+            logger.warning("Order change stream failed (%s); resuming", e)
+            await asyncio.sleep(1)
+        except Exception:
+            logger.exception("Order change stream failed; resuming")
+            await asyncio.sleep(1)
+
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    stream_token: Optional[str] = Query(None)
+):
+    # EventSource cannot set headers, so browsers pass a token from POST /orders/events/token instead
+    if credentials is not None:
+        return await authenticate_token(credentials.credentials)
+    if stream_token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await authenticate_token(stream_token, STREAM_TOKEN_SCOPE)
+
+# Stock Reservation
+async def reserve_stock(produce_id: str, quantity: int) -> dict:
+    # Check and decrement in one conditional update so concurrent buyers cannot oversell
+    produce = await db.produce.find_one_and_update(
+        {"id": produce_id, "is_available": True, "quantity": {"$gte": quantity}},
+        {"$inc": {"quantity": -quantity}},
+        return_document=ReturnDocument.AFTER
+    )
+    if produce is None:
+        # Only the failure path pays for a second read to pick the right error
+        produce = await db.produce.find_one({"id": produce_id}, {"is_available": 1})
+        if not produce:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Produce not found"
+            )
+        if not produce["is_available"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Produce is not available"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Requested quantity exceeds available stock"
+        )
+    
+    if produce["quantity"] == 0:
+        await mark_sold_out(produce_id, produce["farmer_id"])
+    await bump_catalog_version()
+    return produce
+
+async def mark_sold_out(produce_id: str, farmer_id: str):
+    # Matches nothing if a concurrent cancellation already restored stock. sold_out records that a
+    # reservation, not the farmer, took the listing down, so a release may put it back
+    sold_out = await db.produce.update_one(
+        {"id": produce_id, "quantity": 0, "is_available": True},
+        {"$set": {"is_available": False, "sold_out": True}}
+    )
+    if sold_out.modified_count:
+        await increment_user_stats([farmer_id], {"active_produce": -1})
+
+async def reserve_stock_bulk(quantities: dict) -> dict:
+    """Reserve several listings in one bulk_write and return the reserved listings by id.
+    
+    The listings are read back after the reservation, so their price is the one the stock was taken at.
+    """
+    if not quantities:
+        return {}
+    
+    # Each successful update tags the listing so a partial match can be told apart; held_at lets
+    # sweep_checkout_holds clear tags a crashed checkout never removed
+    hold = {"id": str(uuid.uuid4()), "held_at": datetime.utcnow()}
+    await db.produce.bulk_write([
+        UpdateOne(
+            {"id": produce_id, "is_available": True, "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity}, "$push": {"checkout_holds": hold}}
+        )
+        for produce_id, quantity in quantities.items()
+    ], ordered=False)
+    
+    tagged = {"id": {"$in": list(quantities)}, "checkout_holds": {"$elemMatch": {"id": hold["id"]}}}
+    held = await db.produce.find(
+        tagged, {"_id": 0, "id": 1, "farmer_id": 1, "quantity": 1, "price": 1}
+    ).to_list(len(quantities))
+    await db.produce.update_many(tagged, {"$pull": {"checkout_holds": {"id": hold["id"]}}})
+    
+    for produce in held:
+        if produce["quantity"] == 0:
+            await mark_sold_out(produce["id"], produce["farmer_id"])
+    if held:
+        await bump_catalog_version()
+    return {produce["id"]: produce for produce in held}
+
+async def mark_restocked(produce_id: str, farmer_id: str):
+    # Matches nothing if a concurrent reservation sold it out again, another release got there first
+    # or the farmer has since edited the listing
+    restocked = await db.produce.update_one(
+        {"id": produce_id, "quantity": {"$gt": 0}, "is_available": False, "sold_out": True},
+        {"$set": {"is_available": True}, "$unset": {"sold_out": ""}}
+    )
+    if restocked.modified_count:
+        await increment_user_stats([farmer_id], {"active_produce": 1})
+
+async def release_stock_bulk(quantities: dict):
+    """Put reserved stock back in one bulk_write, relisting anything a reservation sold out."""
+    if not quantities:
+        return
+    await db.produce.bulk_write([
+        UpdateOne({"id": produce_id}, {"$inc": {"quantity": quantity}})
+        for produce_id, quantity in quantities.items()
+    ], ordered=False)
+    
+    restocked = await db.produce.find(
+        {"id": {"$in": list(quantities)}, "quantity": {"$gt": 0}, "is_available": False, "sold_out": True},
+        {"_id": 0, "id": 1, "farmer_id": 1}
+    ).to_list(len(quantities))
+    for produce in restocked:
+        await mark_restocked(produce["id"], produce["farmer_id"])
+    await bump_catalog_version()
+
+async def sweep_checkout_holds():
+    """Clear hold tags left on listings by a checkout that died before removing them."""
+    while True:
+        await asyncio.sleep(CHECKOUT_HOLD_TTL_SECONDS)
+        cutoff = datetime.utcnow() - timedelta(seconds=CHECKOUT_HOLD_TTL_SECONDS)
+        try:
+            result = await db.produce.update_many(
+                {"checkout_holds": {"$elemMatch": {"held_at": {"$lt": cutoff}}}},
+                {"$pull": {"checkout_holds": {"held_at": {"$lt": cutoff}}}}
+            )
+        except PyMongoError:
+            logger.exception("Checkout hold sweep failed")
+            continue
+        if result.modified_count:
+            logger.warning("Cleared stale checkout holds from %d listings", result.modified_count)
+
+async def release_stock(produce_id: str, quantity: int) -> Optional[dict]:
+    # A listing the farmer took down stays down; only a reservation's sell-out is undone
+    produce = await db.produce.find_one_and_update(
+        {"id": produce_id},
+        {"$inc": {"quantity": quantity}},
+        return_document=ReturnDocument.AFTER
+    )
+    if produce is not None and produce.get("sold_out"):
+        await mark_restocked(produce_id, produce["farmer_id"])
+    await bump_catalog_version()
+    return produce
+
+# Price Rollups
+# Hourly and daily trade aggregates per (category, region) in db.price_rollups, keyed by bucket start.
+# Orders fold in when placed and back out when cancelled; min/max are not retracted on cancellation
+# until the next rebuild.
+def rollup_bucket(created_at: datetime, granularity: str) -> datetime:
+    if granularity == RollupGranularity.HOUR:
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def price_rollup_updates(orders: List[dict], produce_by_id: dict, sign: int = 1) -> List[UpdateOne]:
+    # Orders sharing a bucket are merged first, so a checkout costs one update per bucket
+    totals = {}
+    for order in orders:
+        # Orders placed before they carried category and region fall back to the listing's current ones
+        series = order if order.get("category") and order.get("region") else produce_by_id.get(order["produce_id"])
+        if series is None:
+            continue
+        for granularity in RollupGranularity:
+            key = (granularity.value, series["category"], series["region"],
+                   rollup_bucket(order["created_at"], granularity))
+            total = totals.setdefault(key, {"volume": 0, "notional": 0.0, "orders": 0, "min": None, "max": None})
+            total["volume"] += sign * order["quantity"]
+            total["notional"] += sign * order["quantity"] * order["unit_price"]
+            total["orders"] += sign
+            total["min"] = min(order["unit_price"], total["min"] if total["min"] is not None else order["unit_price"])
+            total["max"] = max(order["unit_price"], total["max"] if total["max"] is not None else order["unit_price"])
+    
+    operations = []
+    for (granularity, category, region, bucket), total in totals.items():
+        update = {"$inc": {"volume": total["volume"], "notional": total["notional"], "orders": total["orders"]}}
+        if sign > 0:
+            update["$min"] = {"min_price": total["min"]}
+            update["$max"] = {"max_price": total["max"]}
+        operations.append(UpdateOne(
+            {"granularity": granularity, "category": category, "region": region, "bucket": bucket},
+            update,
+            upsert=sign > 0
+        ))
+    return operations
+
+async def record_price_rollups(orders: List[dict], produce_by_id: dict, sign: int = 1, database=None):
+    database = database if database is not None else db
+    operations = price_rollup_updates(orders, produce_by_id, sign)
+    if operations:
+        await database.price_rollups.bulk_write(operations, ordered=False)
+
+async def rebuild_price_rollups(database=None, batch_size: int = 1000) -> int:
+    """Recompute every rollup from the orders collection; returns the number of orders folded in."""
+    database = database if database is not None else db
+    await database.price_rollups.delete_many({})
+    produce_by_id = {}
+    folded = 0
+    batch = []
+    
+    async def fold(orders):
+        missing = list({order["produce_id"] for order in orders if not order.get("category")} - produce_by_id.keys())
+        if missing:
+            async for produce in database.produce.find(
+                {"id": {"$in": missing}}, {"_id": 0, "id": 1, "category": 1, "region": 1}
+            ):
+                produce_by_id[produce["id"]] = produce
+        await record_price_rollups(orders, produce_by_id, database=database)
+    
+    cursor = database.orders.find(
+        {"status": {"$ne": OrderStatus.CANCELLED}},
+        {"_id": 0, "produce_id": 1, "category": 1, "region": 1, "quantity": 1, "unit_price": 1, "created_at": 1},
+        batch_size=batch_size
+    )
+    async for order in cursor:
+        batch.append(order)
+        if len(batch) == batch_size:
+            await fold(batch)
+            folded += len(batch)
+            batch = []
+    if batch:
+        await fold(batch)
+        folded += len(batch)
+    return folded
+
+# Background Jobs
+# Work that does not have to finish before the response is enqueued in db.jobs (see jobs.py).
+# Dashboard counters and price rollups stay inline: a replayed $inc would count twice.
+job_registry = jobs.JobRegistry()
+_job_queue = None
+
+def get_job_queue() -> jobs.JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = jobs.JobQueue(db.jobs, job_registry, JOB_RETENTION_SECONDS)
+    return _job_queue
+
+async def enqueue_jobs(*pending: Optional[tuple]):
+    """Enqueue (type, payload) pairs in one insert; None entries are skipped."""
+    await get_job_queue().enqueue_many([job for job in pending if job is not None])
+
+def new_order_notifications_job(orders: List[dict]) -> tuple:
+    return ("notifications.new_order", {"orders": [
+        {field: order[field] for field in ("id", "farmer_id", "buyer_name", "produce_title", "quantity")}
+        for order in orders
+    ]})
+
+def audit_job(actor_id: str, action: str, subject_type: str, subject_ids: List[str], details: Optional[dict] = None) -> tuple:
+    # Entry ids are fixed at enqueue time so a retried job does not write duplicates
+    now = datetime.utcnow()
+    return ("audit.record", {"entries": [
+        {"id": str(uuid.uuid4()), "at": now, "actor_id": actor_id, "action": action,
+         "subject_type": subject_type, "subject_id": subject_id, "details": details or {}}
+        for subject_id in subject_ids
+    ]})
+
+@job_registry.handler("image.thumbnail", concurrency=2, visibility_timeout=120)
+async def run_thumbnail_job(payload: dict):
+    store = get_image_store()
+    key = thumbnail_key(payload["image_id"])
+    if await store.exists(key):
+        return
+    data = await store.get(payload["image_id"])
+    if data is None:
+        return
+    await store.put(key, await run_in_threadpool(make_thumbnail, data))
+
+@job_registry.handler("notifications.new_order", concurrency=8)
+async def run_new_order_notifications_job(payload: dict):
+    # One notification per order, keyed by order id, so a retry upserts the same document
+    now = datetime.utcnow()
+    await db.notifications.bulk_write([
+        UpdateOne({"id": f"order.created:{order['id']}"}, {"$setOnInsert": Notification(
+            id=f"order.created:{order['id']}",
+            user_id=order["farmer_id"],
+            type="order.created",
+            message=f"{order['buyer_name']} ordered {order['quantity']} of {order['produce_title']}",
+            order_id=order["id"],
+            created_at=now
+        ).dict()}, upsert=True)
+        for order in payload["orders"]
+    ], ordered=False)
+
+@job_registry.handler("audit.record", concurrency=4)
+async def run_audit_job(payload: dict):
+    await db.audit_log.bulk_write([
+        UpdateOne({"id": entry["id"]}, {"$setOnInsert": entry}, upsert=True)
+        for entry in payload["entries"]
+    ], ordered=False)
+
 # Authentication Routes
 @api_router.post("/auth/register", response_model=dict)
 async def register(user_data: UserCreate):
@@ -193,11 +1529,17 @@ async def register(user_data: UserCreate):
         )
     
     # Create new user
-    user_dict = user_data.dict()
-    user_dict["password"] = hash_password(user_dict["password"])
+    user_dict = user_data.dict(exclude={"latitude", "longitude"})
+    user_dict["location"] = geo_point(user_data.latitude, user_data.longitude)
+    user_dict["password"] = await hash_password(user_dict["password"])
     user_obj = User(**user_dict)
     
     await db.users.insert_one(user_obj.dict())
+    await db.user_stats.update_one(
+        {"user_id": user_obj.id},
+        {"$setOnInsert": {**{field: 0 for field in STAT_FIELDS}, "reconciled_at": datetime.utcnow()}},
+        upsert=True
+    )
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -222,12 +1564,26 @@ async def login(user_credentials: UserLogin):
         )
     
     # Verify password
-    if not verify_password(user_credentials.password, user["password"]):
+    if not await verify_password(user_credentials.password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
+    if not user.get("is_active", True):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Account is disabled"
+        )
+    
+    # Upgrade the stored hash when the configured bcrypt cost has changed
+    if password_hasher.needs_rehash(user["password"]):
+        await db.users.update_one(
+            {"id": user["id"], "password": user["password"]},
+            {"$set": {"password": await hash_password(user_credentials.password)}}
+        )
+        invalidate_user(user["id"])
+    
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -244,6 +1600,35 @@ async def login(user_credentials: UserLogin):
 async def get_current_user_info(current_user: UserResponse = Depends(get_current_user)):
     return current_user
 
+async def require_debug_token(x_profile: Optional[str] = Header(None)):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_profile is None or not hmac.compare_digest(x_profile, DEBUG_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Debug token required")
+
+@api_router.get("/stats/cache", dependencies=[Depends(require_debug_token)])
+async def get_cache_stats():
+    response_cache = get_response_cache()
+    return {
+        "users": user_cache.stats(),
+        "tokens": token_cache.stats(),
+        "responses": response_cache.stats() if response_cache is not None else None,
+        "password_hashing": password_hasher.stats()
+    }
+
+@api_router.get("/debug/slow-queries", dependencies=[Depends(require_debug_token)])
+async def get_slow_queries():
+    return {"threshold_ms": SLOW_QUERY_MS, "routes": slow_query_log.by_route()}
+
+@api_router.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_debug_token)])
+async def get_profile(profile_id: str):
+    if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    path = PROFILE_DIR / f"{profile_id}.html"
+    if not path.exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return Response(content=path.read_bytes(), media_type="text/html")
+
 # Produce Routes
 @api_router.post("/produce", response_model=Produce)
 async def create_produce(produce_data: ProduceCreate, current_user: UserResponse = Depends(get_current_user)):
@@ -253,51 +1638,271 @@ async def create_produce(produce_data: ProduceCreate, current_user: UserResponse
             detail="Only farmers can create produce listings"
         )
     
-    produce_dict = produce_data.dict()
+    produce_dict = await produce_write_data(produce_data)
     produce_dict["farmer_id"] = current_user.id
     produce_dict["farmer_name"] = current_user.name
     produce_dict["region"] = current_user.region
+    produce_dict.setdefault("location", current_user.location)
     
     produce_obj = Produce(**produce_dict)
     await db.produce.insert_one(produce_obj.dict())
+    await increment_user_stats([current_user.id], {"total_produce": 1, "active_produce": 1})
+    await enqueue_jobs(audit_job(current_user.id, "produce.created", "produce", [produce_obj.id]))
+    await bump_catalog_version()
     
     return produce_obj
 
-@api_router.get("/produce", response_model=List[Produce])
+def detect_import_format(file: UploadFile) -> DataFormat:
+    filename = (file.filename or "").lower()
+    if filename.endswith(".csv") or file.content_type == "text/csv":
+        return DataFormat.CSV
+    if filename.endswith((".ndjson", ".jsonl")) or file.content_type in ("application/x-ndjson", "application/jsonl"):
+        return DataFormat.NDJSON
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Could not detect import format, pass format=csv or format=ndjson"
+    )
+
+def iter_import_rows(file: UploadFile, import_format: DataFormat):
+    # Reads the spooled upload lazily, one row at a time
+    text = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    if import_format == DataFormat.CSV:
+        for row in csv.DictReader(text):
+            yield {key: value for key, value in row.items() if key is not None and value not in ("", None)}
+    else:
+        for line in text:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    # Yielded rather than raised so one bad line only rejects its own row
+                    yield e
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors())
+
+@api_router.post("/produce/import", response_model=ImportReport)
+async def import_produce(
+    file: UploadFile = File(...),
+    import_format: Optional[DataFormat] = Query(None, alias="format"),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=5000),
+    resume_from: int = Query(1, ge=1),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if current_user.role != UserRole.FARMER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only farmers can create produce listings"
+        )
+    
+    report = ImportReport()
+    rows = iter_import_rows(file, import_format or detect_import_format(file))
+    row_number = 0
+    
+    def record_error(row: int, detail: str):
+        report.rejected += 1
+        if len(report.errors) < MAX_IMPORT_ERRORS:
+            report.errors.append(ImportRowError(row=row, detail=detail))
+        else:
+            report.errors_truncated = True
+    
+    while True:
+        try:
+            chunk = await run_in_threadpool(lambda: list(itertools.islice(rows, batch_size)))
+        except (UnicodeDecodeError, csv.Error) as e:
+            record_error(row_number + 1, f"Could not parse file: {e}")
+            break
+        if not chunk:
+            break
+        
+        batch, batch_rows = [], []
+        for row in chunk:
+            row_number += 1
+            if row_number < resume_from:
+                continue
+            if isinstance(row, json.JSONDecodeError):
+                record_error(row_number, f"Invalid JSON: {row}")
+                continue
+            try:
+                produce_dict = await produce_write_data(ProduceCreate(**row))
+            except ValidationError as e:
+                record_error(row_number, format_validation_error(e))
+                continue
+            except HTTPException as e:
+                record_error(row_number, e.detail)
+                continue
+            except TypeError:
+                record_error(row_number, "Row must be an object")
+                continue
+            produce_dict["farmer_id"] = current_user.id
+            produce_dict["farmer_name"] = current_user.name
+            produce_dict["region"] = current_user.region
+            produce_dict.setdefault("location", current_user.location)
+            batch.append(Produce(**produce_dict).dict())
+            batch_rows.append(row_number)
+        
+        if not batch:
+            continue
+        try:
+            await db.produce.insert_many(batch, ordered=True)
+            inserted = len(batch)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            report.resume_from = batch_rows[inserted]
+        except PyMongoError as e:
+            # Connection lost or similar: the batch may be partly saved, but the driver cannot say how much
+            logger.warning("Produce import batch from row %d failed: %s", batch_rows[0], e)
+            inserted = 0
+            report.resume_from = batch_rows[0]
+        report.imported += inserted
+        if inserted:
+            await increment_user_stats([current_user.id], {"total_produce": inserted, "active_produce": inserted})
+            await enqueue_jobs(
+                audit_job(current_user.id, "produce.imported", "produce", [doc["id"] for doc in batch[:inserted]])
+            )
+            await bump_catalog_version()
+        if report.resume_from is not None:
+            break
+    
+    return report
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def iter_export_chunks(cursor, fields: List[str], export_format: DataFormat):
+    # Rows are encoded and flushed in small chunks straight off the Motor cursor
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == DataFormat.CSV else None
+    if writer:
+        writer.writerow(fields)
+    rows = 0
+    async for doc in cursor:
+        values = [export_value(doc.get(field)) for field in fields]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(fields, values))))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(cursor, fields: List[str], export_format: DataFormat, name: str) -> StreamingResponse:
+    media_type = "text/csv" if export_format == DataFormat.CSV else "application/x-ndjson"
+    return StreamingResponse(
+        iter_export_chunks(cursor, fields, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format.value}"'}
+    )
+
+def created_at_range(created_from: Optional[datetime], created_to: Optional[datetime]) -> dict:
+    created_at = {}
+    if created_from:
+        created_at["$gte"] = created_from
+    if created_to:
+        created_at["$lt"] = created_to
+    return {"created_at": created_at} if created_at else {}
+
+@api_router.get("/produce/export")
+async def export_produce(
+    export_format: DataFormat = Query(DataFormat.NDJSON, alias="format"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if current_user.role != UserRole.FARMER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only farmers can export produce listings"
+        )
+    
+    query = {"farmer_id": current_user.id, **created_at_range(created_from, created_to)}
+    projection = {field: 1 for field in PRODUCE_EXPORT_FIELDS}
+    projection["_id"] = 0
+    cursor = db.produce.find(query, projection, batch_size=EXPORT_BATCH_SIZE)
+    return export_response(cursor, PRODUCE_EXPORT_FIELDS, export_format, "produce")
+
+@api_router.get("/produce", response_model=ProducePage)
 async def get_all_produce(
+    request: Request,
     category: Optional[ProduceCategory] = None,
     region: Optional[Region] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(NEAR_DEFAULT_RADIUS_KM, gt=0, le=NEAR_MAX_RADIUS_KM),
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
+    terms = search_terms(search)
     query = {"is_available": True}
     
     if category:
         query["category"] = category
     if region:
         query["region"] = region
-    if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
     
-    produce_list = await db.produce.find(query).to_list(1000)
-    return [Produce(**produce) for produce in produce_list]
-
-@api_router.get("/produce/{produce_id}", response_model=Produce)
-async def get_produce(produce_id: str):
-    produce = await db.produce.find_one({"id": produce_id})
-    if not produce:
+    near = geo_point(lat, lon)
+    if near and terms:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Produce not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="search cannot be combined with lat/lon"
         )
-    return Produce(**produce)
+    
+    params = {"category": category, "region": region, "search": terms, "after": after, "limit": limit}
+    if near:
+        # Rounded to ~100 m so nearby callers share cache entries
+        lat, lon = round(lat, 3), round(lon, 3)
+        params.update(lat=lat, lon=lon, radius_km=radius_km)
+        build = lambda: fetch_nearby_produce_page(query, lat, lon, radius_km, after, limit)
+    elif terms:
+        build = lambda: search_produce_page(query, terms, after, limit)
+    else:
+        build = lambda: fetch_produce_page(query, after, limit)
+    return await cached_json_response(request, "get_all_produce", params, build)
 
-@api_router.get("/produce/farmer/{farmer_id}", response_model=List[Produce])
-async def get_farmer_produce(farmer_id: str):
-    produce_list = await db.produce.find({"farmer_id": farmer_id}).to_list(1000)
-    return [Produce(**produce) for produce in produce_list]
+@api_router.get("/produce/facets", response_model=ProduceFacets)
+async def get_produce_facets(
+    request: Request,
+    category: Optional[ProduceCategory] = None,
+    region: Optional[Region] = None,
+    search: Optional[str] = None
+):
+    terms = search_terms(search)
+    query = {"is_available": True}
+    if terms:
+        query["$text"] = {"$search": terms}
+    
+    params = {"category": category, "region": region, "search": terms}
+    return await cached_json_response(
+        request, "get_produce_facets", params,
+        lambda: compute_produce_facets(query, category and category.value, region and region.value)
+    )
+
+@api_router.get("/produce/{produce_id}", response_model=Produce)
+async def get_produce(request: Request, produce_id: str):
+    async def build():
+        produce = await db.produce.find_one({"id": produce_id}, PRODUCE_PROJECTION)
+        if not produce:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Produce not found"
+            )
+        return trusted_documents([produce], PRODUCE_DEFAULTS)[0]
+    
+    return await cached_json_response(request, "get_produce", {"id": produce_id}, build)
+
+@api_router.get("/produce/farmer/{farmer_id}", response_model=ProducePage)
+async def get_farmer_produce(
+    farmer_id: str,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    return ORJSONResponse(await fetch_produce_page({"farmer_id": farmer_id}, after, limit))
 
 @api_router.put("/produce/{produce_id}", response_model=Produce)
 async def update_produce(
@@ -305,27 +1910,85 @@ async def update_produce(
     produce_data: ProduceCreate,
     current_user: UserResponse = Depends(get_current_user)
 ):
-    produce = await db.produce.find_one({"id": produce_id})
-    if not produce:
+    # Ownership is part of the filter and the updated document comes back in the same round trip
+    update_data = await produce_write_data(produce_data)
+    # A restock brings a sold-out listing back, and setting quantity to 0 takes it down
+    available = update_data["quantity"] > 0
+    update_data["is_available"] = available
+    # Most edits keep availability as it was; the filter tells whether this one flipped it
+    active_delta = 0
+    produce = None
+    for previous_available in (available, not available):
+        produce = await db.produce.find_one_and_update(
+            {"id": produce_id, "farmer_id": current_user.id, "is_available": previous_available},
+            {"$set": update_data, "$unset": {"image_data": "", "sold_out": ""}},
+            projection=PRODUCE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if produce is not None:
+            active_delta = available - previous_available
+            break
+    if produce is None:
+        if not await db.produce.find_one({"id": produce_id}, {"_id": 1}):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Produce not found"
+            )
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Produce not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to update this produce"
         )
+    if active_delta:
+        await increment_user_stats([current_user.id], {"active_produce": active_delta})
+    await enqueue_jobs(audit_job(current_user.id, "produce.updated", "produce", [produce_id]))
+    await bump_catalog_version()
     
-    if produce["farmer_id"] != current_user.id:
+    return trusted_documents([produce], PRODUCE_DEFAULTS)[0]
+
+# Image Routes
+@api_router.post("/images", response_model=ImageUploadResponse)
+async def upload_image(file: UploadFile = File(...), current_user: UserResponse = Depends(get_current_user)):
+    if current_user.role != UserRole.FARMER:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this produce"
+            detail="Only farmers can upload produce images"
         )
     
-    update_data = produce_data.dict()
-    await db.produce.update_one(
-        {"id": produce_id},
-        {"$set": update_data}
-    )
+    data = await file.read(MAX_IMAGE_BYTES + 1)
+    return ImageUploadResponse(image_id=await store_image(data))
+
+async def image_response(key: str, image_id: str, if_none_match: Optional[str]) -> Response:
+    etag = f'"{key}"'
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     
-    updated_produce = await db.produce.find_one({"id": produce_id})
-    return Produce(**updated_produce)
+    data = None
+    if IMAGE_ID_PATTERN.match(image_id):
+        data = await get_image_store().get(key)
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    return Response(content=data, media_type=sniff_image_type(data), headers=headers)
+
+@api_router.get("/images/{image_id}")
+async def get_image(image_id: str, if_none_match: Optional[str] = Header(None)):
+    return await image_response(image_id, image_id, if_none_match)
+
+@api_router.get("/images/{image_id}/thumbnail")
+async def get_image_thumbnail(image_id: str, if_none_match: Optional[str] = Header(None)):
+    try:
+        return await image_response(thumbnail_key(image_id), image_id, if_none_match)
+    except HTTPException as e:
+        if e.status_code != status.HTTP_404_NOT_FOUND:
+            raise
+    # The thumbnail job has not run yet: serve the original, and keep clients from caching it
+    response = await image_response(image_id, image_id, None)
+    response.headers["Cache-Control"] = "no-cache"
+    del response.headers["ETag"]
+    return response
 
 # Order Routes
 @api_router.post("/orders", response_model=Order)
@@ -339,25 +2002,13 @@ async def create_order(
             detail="Only buyers can create orders"
         )
     
-    # Get produce details
-    produce = await db.produce.find_one({"id": order_data.produce_id})
-    if not produce:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Produce not found"
-        )
-    
-    if not produce["is_available"]:
+    if order_data.quantity <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Produce is not available"
+            detail="Quantity must be positive"
         )
     
-    if order_data.quantity > produce["quantity"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Requested quantity exceeds available stock"
-        )
+    produce = await reserve_stock(order_data.produce_id, order_data.quantity)
     
     # Calculate total amount
     total_amount = order_data.quantity * produce["price"]
@@ -370,6 +2021,8 @@ async def create_order(
         "buyer_name": current_user.name,
         "farmer_name": produce["farmer_name"],
         "produce_title": produce["title"],
+        "category": produce["category"],
+        "region": produce["region"],
         "quantity": order_data.quantity,
         "unit_price": produce["price"],
         "total_amount": total_amount,
@@ -377,86 +2030,551 @@ async def create_order(
     }
     
     order_obj = Order(**order_dict)
-    await db.orders.insert_one(order_obj.dict())
+    try:
+        await db.orders.insert_one(order_obj.dict())
+    except Exception:
+        await release_stock(order_obj.produce_id, order_obj.quantity)
+        raise
+    stats_deltas = {"total_orders": 1, **order_status_deltas(None, order_obj.status)}
+    await increment_user_stats([order_obj.farmer_id, order_obj.buyer_id], stats_deltas)
+    await record_price_rollups([order_obj.dict()], {produce["id"]: produce})
+    await enqueue_jobs(
+        new_order_notifications_job([order_obj.dict()]),
+        audit_job(current_user.id, "order.created", "order", [order_obj.id])
+    )
+    publish_order_event("order.created", order_obj.dict(), stats_deltas)
     
     return order_obj
 
+@api_router.post("/orders/checkout", response_model=CheckoutResponse)
+async def checkout(
+    checkout_data: CheckoutRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if current_user.role != UserRole.BUYER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only buyers can create orders"
+        )
+    
+    if not checkout_data.items or len(checkout_data.items) > MAX_CHECKOUT_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Checkout must contain between 1 and {MAX_CHECKOUT_ITEMS} items"
+        )
+    
+    # Repeated listings are merged into a single order line
+    quantities = {}
+    for item in checkout_data.items:
+        if item.quantity <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Quantity must be positive"
+            )
+        quantities[item.produce_id] = quantities.get(item.produce_id, 0) + item.quantity
+    
+    produce_by_id = {
+        produce["id"]: produce
+        for produce in await db.produce.find(
+            {"id": {"$in": list(quantities)}},
+            {"_id": 0, "image_id": 0, "description": 0}
+        ).to_list(len(quantities))
+    }
+    
+    failures = {}
+    for produce_id, quantity in quantities.items():
+        produce = produce_by_id.get(produce_id)
+        if produce is None:
+            failures[produce_id] = "Produce not found"
+        elif not produce["is_available"]:
+            failures[produce_id] = "Produce is not available"
+        elif quantity > produce["quantity"]:
+            failures[produce_id] = "Requested quantity exceeds available stock"
+    
+    def reject_checkout():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=[CheckoutFailure(produce_id=pid, detail=detail).dict() for pid, detail in failures.items()]
+        )
+    
+    if failures and checkout_data.mode == CheckoutMode.ATOMIC:
+        reject_checkout()
+    
+    reserved = await reserve_stock_bulk(
+        {pid: quantity for pid, quantity in quantities.items() if pid not in failures}
+    )
+    for produce_id in quantities:
+        if produce_id not in failures and produce_id not in reserved:
+            failures[produce_id] = "Requested quantity exceeds available stock"
+    
+    if failures and checkout_data.mode == CheckoutMode.ATOMIC:
+        await release_stock_bulk({pid: quantities[pid] for pid in reserved})
+        reject_checkout()
+    
+    orders = []
+    for produce_id, held in reserved.items():
+        produce = produce_by_id[produce_id]
+        orders.append(Order(
+            produce_id=produce_id,
+            farmer_id=produce["farmer_id"],
+            buyer_id=current_user.id,
+            buyer_name=current_user.name,
+            farmer_name=produce["farmer_name"],
+            produce_title=produce["title"],
+            category=produce["category"],
+            region=produce["region"],
+            quantity=quantities[produce_id],
+            unit_price=held["price"],
+            total_amount=quantities[produce_id] * held["price"],
+            status=OrderStatus.PENDING
+        ))
+    
+    if orders:
+        try:
+            await db.orders.insert_many([order.dict() for order in orders])
+        except Exception:
+            await release_stock_bulk({pid: quantities[pid] for pid in reserved})
+            raise
+        
+        deltas_by_user = {current_user.id: {"total_orders": len(orders), "pending_orders": len(orders)}}
+        for order in orders:
+            farmer_deltas = deltas_by_user.setdefault(order.farmer_id, {"total_orders": 0, "pending_orders": 0})
+            farmer_deltas["total_orders"] += 1
+            farmer_deltas["pending_orders"] += 1
+        order_dicts = [order.dict() for order in orders]
+        await bulk_increment_user_stats(deltas_by_user)
+        await record_price_rollups(order_dicts, produce_by_id)
+        await enqueue_jobs(
+            new_order_notifications_job(order_dicts),
+            audit_job(current_user.id, "order.created", "order", [order.id for order in orders])
+        )
+        for order in orders:
+            publish_order_event(
+                "order.created", order.dict(), {"total_orders": 1, **order_status_deltas(None, order.status)}
+            )
+    
+    return CheckoutResponse(
+        orders=orders,
+        failures=[CheckoutFailure(produce_id=pid, detail=detail) for pid, detail in failures.items()]
+    )
+
+@api_router.get("/orders/export")
+async def export_orders(
+    export_format: DataFormat = Query(DataFormat.NDJSON, alias="format"),
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    if current_user.role == UserRole.BUYER:
+        query = {"buyer_id": current_user.id}
+    elif current_user.role == UserRole.FARMER:
+        query = {"farmer_id": current_user.id}
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only farmers and buyers can export orders"
+        )
+    
+    if order_status:
+        query["status"] = order_status
+    query.update(created_at_range(created_from, created_to))
+    projection = {field: 1 for field in ORDER_EXPORT_FIELDS}
+    projection["_id"] = 0
+    cursor = db.orders.find(query, projection, batch_size=EXPORT_BATCH_SIZE)
+    return export_response(cursor, ORDER_EXPORT_FIELDS, export_format, "orders")
+
 @api_router.get("/orders", response_model=List[Order])
 async def get_user_orders(current_user: UserResponse = Depends(get_current_user)):
     if current_user.role == UserRole.BUYER:
-        orders = await db.orders.find({"buyer_id": current_user.id}).to_list(1000)
+        orders = await db.orders.find({"buyer_id": current_user.id}, ORDER_PROJECTION).to_list(1000)
     elif current_user.role == UserRole.FARMER:
-        orders = await db.orders.find({"farmer_id": current_user.id}).to_list(1000)
+        orders = await db.orders.find({"farmer_id": current_user.id}, ORDER_PROJECTION).to_list(1000)
     else:
         orders = []
     
-    return [Order(**order) for order in orders]
+    return ORJSONResponse(trusted_documents(orders, ORDER_DEFAULTS))
+
+@api_router.post("/orders/events/token")
+async def create_stream_token(current_user: UserResponse = Depends(get_current_user)):
+    stream_token = create_access_token(
+        {"sub": current_user.id, "scope": STREAM_TOKEN_SCOPE}, timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+    return {"stream_token": stream_token, "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@api_router.get("/orders/events")
+async def stream_order_events(current_user: UserResponse = Depends(get_stream_user)):
+    if current_user.role not in (UserRole.BUYER, UserRole.FARMER):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only farmers and buyers receive order events"
+        )
+    
+    async def events():
+        queue = order_events.subscribe(current_user.id)
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), ORDER_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"data: " + payload + b"\n\n"
+        finally:
+            order_events.unsubscribe(current_user.id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.put("/orders/{order_id}/status", response_model=Order)
 async def update_order_status(
     order_id: str,
-    status: OrderStatus,
+    new_status: OrderStatus = Query(..., alias="status"),
     current_user: UserResponse = Depends(get_current_user)
 ):
-    order = await db.orders.find_one({"id": order_id})
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
+    # Paid or delivered goods have changed hands, so cancelling them must not put stock back on sale
+    if new_status == OrderStatus.CANCELLED:
+        order_filter = {"id": order_id, "status": {"$in": CANCELLABLE_STATUSES}}
+    else:
+        order_filter = {"id": order_id, "status": {"$ne": OrderStatus.CANCELLED}}
+    if current_user.role == UserRole.FARMER:
+        order_filter["farmer_id"] = current_user.id
+    elif current_user.role == UserRole.BUYER:
+        order_filter["buyer_id"] = current_user.id
     
-    # Check authorization
-    if current_user.role == UserRole.FARMER and order["farmer_id"] != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this order"
-        )
-    elif current_user.role == UserRole.BUYER and order["buyer_id"] != current_user.id:
+    # The previous status is needed for counters; the new document is the old one plus this $set
+    changes = {"status": new_status, "updated_at": datetime.utcnow()}
+    previous_order = await db.orders.find_one_and_update(
+        order_filter,
+        {"$set": changes},
+        projection=ORDER_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous_order is None:
+        # Only a miss pays for a second read, to tell 404, 403 and cancelled apart
+        order = await db.orders.find_one({"id": order_id}, ORDER_PROJECTION)
+        if not order:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
+        if (current_user.role == UserRole.FARMER and order["farmer_id"] != current_user.id) or \
+                (current_user.role == UserRole.BUYER and order["buyer_id"] != current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to update this order"
+            )
+        # Cancelled orders have released their stock and cannot be reopened
+        if order["status"] == OrderStatus.CANCELLED and new_status == OrderStatus.CANCELLED:
+            return trusted_documents([order], ORDER_DEFAULTS)[0]
+        if order["status"] != OrderStatus.CANCELLED:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only pending or confirmed orders can be cancelled"
+            )
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this order"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cancelled orders cannot be reopened"
         )
     
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+    if new_status == OrderStatus.CANCELLED:
+        produce = await release_stock(previous_order["produce_id"], previous_order["quantity"])
+        if produce is not None:
+            await record_price_rollups([previous_order], {produce["id"]: produce}, sign=-1)
+    stats_deltas = order_status_deltas(previous_order["status"], new_status)
+    await increment_user_stats([previous_order["farmer_id"], previous_order["buyer_id"]], stats_deltas)
+    await enqueue_jobs(
+        audit_job(current_user.id, "order.status_changed", "order", [order_id],
+                  {"from": previous_order["status"], "to": new_status.value})
     )
+    # Only the fields that changed, plus the ids clients need to route the event
+    publish_order_event("order.updated", {
+        "id": order_id,
+        "buyer_id": previous_order["buyer_id"],
+        "farmer_id": previous_order["farmer_id"],
+        **changes
+    }, stats_deltas)
     
-    updated_order = await db.orders.find_one({"id": order_id})
-    return Order(**updated_order)
+    return trusted_documents([{**previous_order, **changes}], ORDER_DEFAULTS)[0]
+
+# Notification Routes
+@api_router.get("/notifications", response_model=List[Notification])
+async def get_notifications(
+    unread_only: bool = False,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    query = {"user_id": current_user.id}
+    if unread_only:
+        query["read"] = False
+    cursor = db.notifications.find(query, {"_id": 0}).sort("created_at", DESCENDING).limit(NOTIFICATION_PAGE_SIZE)
+    return ORJSONResponse(await cursor.to_list(NOTIFICATION_PAGE_SIZE))
+
+@api_router.post("/notifications/read")
+async def mark_notifications_read(current_user: UserResponse = Depends(get_current_user)):
+    result = await db.notifications.update_many({"user_id": current_user.id, "read": False}, {"$set": {"read": True}})
+    return {"updated": result.modified_count}
 
 # Dashboard Routes
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: UserResponse = Depends(get_current_user)):
-    stats = {}
+    fields = DASHBOARD_FIELDS.get(current_user.role)
+    if not fields:
+        return {}
     
-    if current_user.role == UserRole.FARMER:
-        # Farmer stats
-        total_produce = await db.produce.count_documents({"farmer_id": current_user.id})
-        active_produce = await db.produce.count_documents({"farmer_id": current_user.id, "is_available": True})
-        total_orders = await db.orders.count_documents({"farmer_id": current_user.id})
-        pending_orders = await db.orders.count_documents({"farmer_id": current_user.id, "status": OrderStatus.PENDING})
-        
-        stats = {
-            "total_produce": total_produce,
-            "active_produce": active_produce,
-            "total_orders": total_orders,
-            "pending_orders": pending_orders
-        }
+    counters = await db.user_stats.find_one({"user_id": current_user.id}, {"_id": 0})
+    if counters is None or "reconciled_at" not in counters:
+        # Counters not seeded yet (pre-existing user); fall back to aggregation
+        counters = await aggregate_user_stats(current_user.id, current_user.role)
     
-    elif current_user.role == UserRole.BUYER:
-        # Buyer stats
-        total_orders = await db.orders.count_documents({"buyer_id": current_user.id})
-        pending_orders = await db.orders.count_documents({"buyer_id": current_user.id, "status": OrderStatus.PENDING})
-        completed_orders = await db.orders.count_documents({"buyer_id": current_user.id, "status": OrderStatus.DELIVERED})
-        
-        stats = {
-            "total_orders": total_orders,
-            "pending_orders": pending_orders,
-            "completed_orders": completed_orders
-        }
+    return {field: counters.get(field, 0) for field in fields}
+
+# Price Routes
+@api_router.get("/prices/series", response_model=PriceSeries)
+async def get_price_series(
+    category: ProduceCategory,
+    region: Optional[Region] = None,
+    granularity: RollupGranularity = RollupGranularity.HOUR,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    end = end or datetime.utcnow()
+    start = start or end - ROLLUP_DEFAULT_RANGES[granularity.value]
+    if start >= end or (end - start) / ROLLUP_BUCKET_SIZES[granularity.value] > MAX_ROLLUP_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range must be positive and span at most {MAX_ROLLUP_POINTS} {granularity.value}s"
+        )
     
-    return stats
+    query = {
+        "granularity": granularity,
+        "category": category,
+        "bucket": {"$gte": rollup_bucket(start, granularity), "$lt": end},
+    }
+    if region:
+        query["region"] = region
+    rollups = await db.price_rollups.find(query, {"_id": 0}).sort("bucket", ASCENDING).to_list(None)
+    
+    # Without a region the per-region rollups of a bucket are merged
+    merged = {}
+    for rollup in rollups:
+        point = merged.get(rollup["bucket"])
+        if point is None:
+            merged[rollup["bucket"]] = dict(rollup)
+            continue
+        point["volume"] += rollup["volume"]
+        point["notional"] += rollup["notional"]
+        point["orders"] += rollup["orders"]
+        point["min_price"] = min(point["min_price"], rollup["min_price"])
+        point["max_price"] = max(point["max_price"], rollup["max_price"])
+    
+    points = [
+        PricePoint(
+            bucket=point["bucket"],
+            vwap=point["notional"] / point["volume"],
+            min_price=point["min_price"],
+            max_price=point["max_price"],
+            volume=point["volume"],
+            orders=point["orders"]
+        )
+        for point in merged.values() if point["volume"] > 0
+    ]
+    return PriceSeries(category=category, region=region, granularity=granularity, points=points)
+
+# Health Routes
+@api_router.get("/health/live")
+async def liveness():
+    # The event loop is serving requests; says nothing about MongoDB
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    # Ready once the pool is warm and a pooled connection answers a ping in time. A pool
+    # exhausted for longer than the timeout also reports not ready, so traffic shifts away.
+    if not _database_ready:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Starting up")
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), HEALTH_CHECK_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, PyMongoError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database unavailable: {type(e).__name__}"
+        )
+    return {"status": "ready", "ping_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+# Index Management
+# Every index the route queries rely on, as (keys, options) per collection
+INDEXES = {
+    "users": [
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+    ],
+    "produce": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("is_available", ASCENDING), ("category", ASCENDING), ("region", ASCENDING), ("created_at", DESCENDING)],
+         {"name": "catalog"}),
+        # Unfiltered catalog pages: newest available listings without a sort over all of them
+        ([("is_available", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {"name": "catalog_recent"}),
+        ([("farmer_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {"name": "farmer_listing"}),
+        ([("title", TEXT), ("description", TEXT), ("farmer_name", TEXT)],
+         {"name": "produce_text", "weights": {"title": 10, "farmer_name": 3, "description": 1}}),
+        ([("location", GEOSPHERE), ("is_available", ASCENDING), ("category", ASCENDING)], {"name": "nearby"}),
+        ([("checkout_holds.held_at", ASCENDING)], {"name": "checkout_holds", "sparse": True}),
+    ],
+    "jobs": [
+        ([("status", ASCENDING), ("available_at", ASCENDING)], {"name": "claim"}),
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+    "notifications": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("user_id", ASCENDING), ("created_at", DESCENDING)], {"name": "user_feed"}),
+    ],
+    "audit_log": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("subject_type", ASCENDING), ("subject_id", ASCENDING), ("at", DESCENDING)], {"name": "subject_history"}),
+    ],
+    "orders": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("farmer_id", ASCENDING), ("status", ASCENDING)], {"name": "farmer_status"}),
+        ([("buyer_id", ASCENDING), ("status", ASCENDING)], {"name": "buyer_status"}),
+    ],
+    "user_stats": [
+        ([("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    ],
+    "price_rollups": [
+        ([("granularity", ASCENDING), ("category", ASCENDING), ("region", ASCENDING), ("bucket", ASCENDING)],
+         {"name": "series_unique", "unique": True}),
+    ],
+    "response_cache": [
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+}
+
+# Representative query shape of each route, used by the index check
+QUERY_SHAPES = [
+    ("register/login", "users", {"email": ""}, None),
+    ("get_current_user", "users", {"id": ""}, None),
+    ("get_all_produce", "produce", {"is_available": True}, [("created_at", -1), ("id", -1)]),
+    ("get_all_produce:category", "produce",
+     {"is_available": True, "category": ProduceCategory.GRAINS.value}, [("created_at", -1), ("id", -1)]),
+    ("get_all_produce:category+region", "produce",
+     {"is_available": True, "category": ProduceCategory.GRAINS.value, "region": Region.ACCRA.value},
+     [("created_at", -1), ("id", -1)]),
+    ("get_all_produce:search", "produce", {"is_available": True, "$text": {"$search": "maize"}}, None),
+    ("get_all_produce:near", "produce",
+     {"location": {"$nearSphere": {"$geometry": {"type": "Point", "coordinates": [-0.187, 5.604]},
+                                   "$maxDistance": 50000}},
+      "is_available": True}, None),
+    ("get_produce", "produce", {"id": ""}, None),
+    ("get_farmer_produce", "produce", {"farmer_id": ""}, [("created_at", -1), ("id", -1)]),
+    ("get_user_orders:buyer", "orders", {"buyer_id": ""}, None),
+    ("get_user_orders:farmer", "orders", {"farmer_id": ""}, None),
+    ("get_order", "orders", {"id": ""}, None),
+    ("get_dashboard_stats", "user_stats", {"user_id": ""}, None),
+    ("get_notifications", "notifications", {"user_id": ""}, [("created_at", -1)]),
+    ("job_claim", "jobs",
+     {"status": {"$in": [jobs.QUEUED, jobs.RUNNING]}, "type": {"$in": ["audit.record"]},
+      "available_at": {"$lte": datetime(2024, 1, 1)}}, [("available_at", 1)]),
+    ("get_price_series", "price_rollups",
+     {"granularity": "hour", "category": ProduceCategory.GRAINS.value, "region": Region.ACCRA.value,
+      "bucket": {"$gte": datetime(2024, 1, 1)}}, [("bucket", 1)]),
+    ("aggregate_user_stats:farmer", "orders", {"farmer_id": ""}, None),
+    ("aggregate_user_stats:buyer", "orders", {"buyer_id": ""}, None),
+]
+
+async def ensure_indexes(database=None):
+    database = database if database is not None else db
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                await database[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. duplicate emails blocking a unique index; keep serving and report it
+                logger.error(f"Could not create index {collection}.{options['name']}: {e}")
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+def _plan_indexes(plan: dict) -> List[str]:
+    indexes = [plan["indexName"]] if "indexName" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            indexes.extend(_plan_indexes(plan[key]))
+    for child in plan.get("inputStages", []):
+        indexes.extend(_plan_indexes(child))
+    return indexes
+
+def _explain_summary(explain: dict) -> dict:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations that are not pushed down entirely report the plan of their $cursor stage
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    if planner is None:
+        return {"stages": None, "indexes": []}
+    winning = planner["winningPlan"]
+    return {
+        "stages": _plan_stages(winning),
+        "indexes": _plan_indexes(winning),
+        "rejected_plans": len(planner.get("rejectedPlans", [])),
+    }
+
+async def explain_slow_queries():
+    """Drain the slow-query listener, explaining each new query shape once."""
+    while True:
+        await asyncio.sleep(1)
+        while slow_query_log.pending:
+            entry = slow_query_log.pending.popleft()
+            plan = None
+            if slow_query_log.needs_plan(entry):
+                try:
+                    explain = await client[entry["database"]].command(
+                        {"explain": entry["explain"], "verbosity": "queryPlanner"}
+                    )
+                    plan = _explain_summary(explain)
+                except OperationFailure as e:
+                    plan = {"error": str(e)}
+            slow_query_log.record(entry, plan)
+
+def _index_signature(keys) -> list:
+    # A collection has at most one text index, and the server reports it as _fts/_ftsx keys
+    if any(d == TEXT for _, d in keys):
+        return [("_fts", TEXT)]
+    return [(k, d if d == GEOSPHERE else int(d)) for k, d in keys]
+
+async def check_indexes(database=None) -> dict:
+    database = database if database is not None else db
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = await database[collection].index_information()
+        existing_keys = [_index_signature(info["key"]) for info in existing.values()]
+        for keys, options in indexes:
+            if _index_signature(keys) not in existing_keys:
+                missing.append({"collection": collection, "name": options["name"], "keys": keys})
+    
+    collection_scans = []
+    for route, collection, query, sort in QUERY_SHAPES:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explain = await database.command("explain", command, verbosity="queryPlanner")
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            collection_scans.append({"route": route, "collection": collection, "filter": query, "plan": stages})
+    
+    return {"missing_indexes": missing, "collection_scans": collection_scans}
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -469,6 +2587,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(diagnostics.DiagnosticsMiddleware, profiling_token=DEBUG_TOKEN, profile_dir=PROFILE_DIR)
+
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.track_password_hasher(password_hasher)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        body, content_type = metrics.render()
+        return Response(content=body, headers={"Content-Type": content_type})
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -476,6 +2605,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Registered first, so every later startup hook finds the client open
+@app.on_event("startup")
+async def startup_database():
+    global _database_ready
+    connect_database()
+    await warm_connection_pool()
+    _database_ready = True
+
+@app.on_event("startup")
+async def startup_indexes():
+    if os.environ.get('ENSURE_INDEXES', 'true').lower() == 'true':
+        await ensure_indexes()
+
+async def snapshot_memory_engine():
+    while True:
+        await asyncio.sleep(MEMORY_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            await client.snapshot()
+        except OSError:
+            logger.exception("Memory engine snapshot failed")
+
+_snapshot_task = None
+_event_loop_task = None
+_slow_query_task = None
+_order_events_task = None
+_checkout_hold_task = None
+
+@app.on_event("startup")
+async def startup_snapshots():
+    global _snapshot_task
+    if STORAGE_ENGINE == "memory" and MEMORY_SNAPSHOT_PATH:
+        _snapshot_task = asyncio.create_task(snapshot_memory_engine())
+
+@app.on_event("startup")
+async def startup_metrics():
+    global _event_loop_task
+    if METRICS_ENABLED:
+        _event_loop_task = asyncio.create_task(metrics.monitor_event_loop(EVENT_LOOP_LAG_INTERVAL_SECONDS))
+
+@app.on_event("startup")
+async def startup_slow_query_log():
+    global _slow_query_task
+    if SLOW_QUERY_MS > 0 and STORAGE_ENGINE != "memory":
+        _slow_query_task = asyncio.create_task(explain_slow_queries())
+
+@app.on_event("startup")
+async def startup_checkout_hold_sweep():
+    global _checkout_hold_task
+    _checkout_hold_task = asyncio.create_task(sweep_checkout_holds())
+
+@app.on_event("startup")
+async def startup_order_events():
+    global _order_events_task
+    if ORDER_EVENTS_SOURCE == "change_stream" and STORAGE_ENGINE != "memory":
+        _order_events_task = asyncio.create_task(watch_order_changes())
+    else:
+        order_events.publish_from_routes = True
+
+_job_worker = None
+_job_worker_task = None
+
+@app.on_event("startup")
+async def startup_job_worker():
+    global _job_worker, _job_worker_task
+    if JOBS_MODE == "in_process":
+        # The memory engine has no TTL indexes, so the worker deletes expired jobs itself
+        purge_interval = JOB_PURGE_INTERVAL_SECONDS if STORAGE_ENGINE == "memory" else None
+        _job_worker = jobs.JobWorker(get_job_queue(), JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL_SECONDS,
+                                     purge_interval=purge_interval)
+        _job_worker_task = asyncio.create_task(_job_worker.run())
+    elif STORAGE_ENGINE == "memory":
+        logger.warning("JOBS_MODE=%s with the memory engine: no other process can run the jobs", JOBS_MODE)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if _job_worker is not None:
+        # Running jobs get a few seconds to finish; the rest go back to the queue
+        await _job_worker.stop()
+        _job_worker_task.cancel()
+    if _order_events_task is not None:
+        _order_events_task.cancel()
+    if _checkout_hold_task is not None:
+        _checkout_hold_task.cancel()
+    if _slow_query_task is not None:
+        _slow_query_task.cancel()
+    if _event_loop_task is not None:
+        _event_loop_task.cancel()
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        await client.snapshot()
+    if client is not None:
+        client.close()
+    password_hasher.shutdown()
+    if METRICS_ENABLED:
+        metrics.mark_process_dead()
\ No newline at end of file
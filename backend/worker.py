@@ -0,0 +1,65 @@
+"""Background job worker, for running jobs outside the API processes.
+
+Run from the backend directory with the same .env as the server, and set
+JOBS_MODE=external on the API so it only enqueues:
+
+    python -m worker [--concurrency 8] [--types image.thumbnail notifications.new_order]
+
+Any number of workers can run against the same database; each job is leased to
+one of them at a time. SIGTERM or Ctrl-C stops claiming, gives running jobs
+--grace seconds to finish and hands the rest back to the queue.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+import jobs
+import server
+
+logger = logging.getLogger("worker")
+
+
+async def run(args) -> int:
+    server.connect_database()
+    worker = jobs.JobWorker(server.get_job_queue(), args.concurrency, args.poll_interval, args.types)
+    if args.until_empty:
+        await worker.drain()
+        return 0
+
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    task = asyncio.create_task(worker.run())
+    await stopping.wait()
+    logger.info("Stopping, waiting up to %.0fs for running jobs", args.grace)
+    await worker.stop(args.grace)
+    task.cancel()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued background jobs")
+    parser.add_argument("--concurrency", type=int, default=server.JOB_WORKER_CONCURRENCY,
+                        help="Jobs run at once, across all types")
+    parser.add_argument("--types", nargs="+", choices=sorted(server.job_registry.types),
+                        help="Only run these job types (default all)")
+    parser.add_argument("--poll-interval", type=float, default=server.JOB_POLL_INTERVAL_SECONDS)
+    parser.add_argument("--grace", type=float, default=30.0, help="Seconds running jobs get to finish on shutdown")
+    parser.add_argument("--until-empty", action="store_true", help="Exit once no job is due")
+    args = parser.parse_args()
+
+    if server.STORAGE_ENGINE == "memory":
+        logger.error("STORAGE_ENGINE=memory keeps jobs inside the API process; use JOBS_MODE=in_process")
+        return 1
+    try:
+        return asyncio.run(run(args))
+    finally:
+        if server.client is not None:
+            server.client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,19 @@
+import argparse
+import asyncio
+import json
+import random
 import requests
 import sys
 import uuid
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+DEFAULT_BASE_URL = "https://1206913e-7435-45b8-8589-796d4d984a68.preview.emergentagent.com/api"
+
 class AgriMarketTester:
-    def __init__(self, base_url="https://1206913e-7435-45b8-8589-796d4d984a68.preview.emergentagent.com/api"):
+    def __init__(self, base_url=DEFAULT_BASE_URL):
         self.base_url = base_url
         self.token = None
         self.user = None
@@ -56,6 +64,14 @@ class AgriMarketTester:
             print(f"❌ Failed - Error: {str(e)}")
             return False, {}
 
+    def test_health(self):
+        """Test the liveness and readiness probes"""
+        live, _ = self.run_test("Liveness", "GET", "health/live", 200)
+        ready, response = self.run_test("Readiness", "GET", "health/ready", 200)
+        if ready:
+            print(f"Database ping: {response.get('ping_ms')} ms")
+        return live and ready
+
     def test_register_farmer(self):
         """Test farmer registration"""
         timestamp = int(time.time())
@@ -65,7 +81,9 @@ class AgriMarketTester:
             "password": "Password123!",
             "role": "farmer",
             "phone": f"+233{timestamp}",
-            "region": "accra"
+            "region": "accra",
+            "latitude": 5.6037,
+            "longitude": -0.187
         }
         
         success, response = self.run_test(
@@ -177,11 +195,28 @@ class AgriMarketTester:
             200
         )
         
-        if success and isinstance(response, list):
-            print(f"Found {len(response)} produce listings")
+        if success and isinstance(response.get('items'), list):
+            print(f"Found {len(response['items'])} produce listings")
             return True
         return False
 
+    def test_nearby_produce(self):
+        """Test that a listing inherits its farmer's location and is found near it"""
+        success, response = self.run_test(
+            "Get Nearby Produce",
+            "GET",
+            "produce?lat=5.6&lon=-0.19&radius_km=10&limit=100",
+            200
+        )
+        
+        if success:
+            nearby = {item['id']: item['distance_km'] for item in response.get('items', [])}
+            if self.produce_id in nearby:
+                print(f"Produce found {nearby[self.produce_id]} km away")
+                return True
+            print("❌ Created produce missing from nearby results")
+        return False
+
     def test_get_produce_by_id(self):
         """Test getting produce by ID"""
         if not self.produce_id:
@@ -222,6 +257,135 @@ class AgriMarketTester:
             return True
         return False
 
+    def test_concurrent_orders(self, stock=10, buyers=40):
+        """Test that parallel orders on one listing never oversell its stock"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing Concurrent Orders ({buyers} buyers, {stock} units)...")
+
+        produce_data = {
+            "title": f"Hot Listing {uuid.uuid4().hex[:8]}",
+            "category": "grains",
+            "description": "Contended listing for the stock reservation test",
+            "price": 10.0,
+            "quantity": stock,
+            "unit": "bags"
+        }
+        response = requests.post(
+            f"{self.base_url}/produce",
+            json=produce_data,
+            headers={'Authorization': f'Bearer {self.farmer_token}'}
+        )
+        if response.status_code != 200:
+            print(f"❌ Failed - Could not create listing: {response.status_code}")
+            return False
+        produce_id = response.json()['id']
+
+        def place_order(_):
+            return requests.post(
+                f"{self.base_url}/orders",
+                json={"produce_id": produce_id, "quantity": 1},
+                headers={'Authorization': f'Bearer {self.buyer_token}'}
+            ).status_code
+
+        with ThreadPoolExecutor(max_workers=buyers) as executor:
+            status_codes = list(executor.map(place_order, range(buyers)))
+
+        produce = requests.get(f"{self.base_url}/produce/{produce_id}").json()
+        accepted = status_codes.count(200)
+        rejected = status_codes.count(400)
+
+        if accepted == stock and rejected == buyers - stock and produce['quantity'] == 0 \
+                and not produce['is_available']:
+            self.tests_passed += 1
+            print(f"✅ Passed - {accepted} accepted, {rejected} rejected, stock at 0")
+            return True
+
+        print(f"❌ Failed - {accepted} accepted, {rejected} rejected, "
+              f"stock {produce['quantity']}, available {produce['is_available']}")
+        return False
+
+    def test_cancel_rules(self):
+        """Test that a delivered order cannot be cancelled and keeps its stock sold"""
+        self.tests_run += 1
+        print("\n🔍 Testing Cancellation Rules...")
+
+        farmer = {'Authorization': f'Bearer {self.farmer_token}'}
+        buyer = {'Authorization': f'Bearer {self.buyer_token}'}
+        response = requests.post(f"{self.base_url}/orders", json={"produce_id": self.produce_id, "quantity": 1},
+                                 headers=buyer)
+        if response.status_code != 200:
+            print(f"❌ Failed - Could not create order: {response.status_code}")
+            return False
+        order_id = response.json()['id']
+        requests.put(f"{self.base_url}/orders/{order_id}/status", params={"status": "delivered"}, headers=farmer)
+        before = requests.get(f"{self.base_url}/produce/{self.produce_id}").json()['quantity']
+
+        cancel = requests.put(f"{self.base_url}/orders/{order_id}/status", params={"status": "cancelled"},
+                              headers=buyer)
+        after = requests.get(f"{self.base_url}/produce/{self.produce_id}").json()['quantity']
+
+        if cancel.status_code == 400 and after == before:
+            self.tests_passed += 1
+            print(f"✅ Passed - Delivered order refused cancellation, stock stays at {after}")
+            return True
+
+        print(f"❌ Failed - Cancel returned {cancel.status_code}, stock {before} -> {after}")
+        return False
+
+    def test_order_events(self, timeout=10):
+        """Test that the farmer's event stream receives a buyer's new order"""
+        self.tests_run += 1
+        print("\n🔍 Testing Order Event Stream...")
+
+        # Browsers authenticate the stream with a short-lived token in the URL
+        response = requests.post(
+            f"{self.base_url}/orders/events/token",
+            headers={'Authorization': f'Bearer {self.farmer_token}'}
+        )
+        if response.status_code != 200:
+            print(f"❌ Failed - Stream token: expected 200, got {response.status_code}")
+            return False
+        stream_token = response.json()['stream_token']
+        if requests.get(f"{self.base_url}/orders",
+                        headers={'Authorization': f'Bearer {stream_token}'}).status_code != 401:
+            print("❌ Failed - Stream token accepted outside the event stream")
+            return False
+
+        stream = requests.get(
+            f"{self.base_url}/orders/events",
+            params={'stream_token': stream_token},
+            stream=True,
+            timeout=timeout
+        )
+        if stream.status_code != 200:
+            print(f"❌ Failed - Expected 200, got {stream.status_code}")
+            return False
+
+        response = requests.post(
+            f"{self.base_url}/orders",
+            json={"produce_id": self.produce_id, "quantity": 1},
+            headers={'Authorization': f'Bearer {self.buyer_token}'}
+        )
+        order_id = response.json().get('id') if response.status_code == 200 else None
+
+        try:
+            for line in stream.iter_lines(decode_unicode=True):
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event.get("type") == "order.created" and event["order"]["id"] == order_id:
+                    self.tests_passed += 1
+                    print(f"✅ Passed - order.created received for {order_id}")
+                    return True
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+        finally:
+            stream.close()
+
+        print("❌ Failed - Stream ended without the order event")
+        return False
+
     def test_get_orders(self):
         """Test getting user orders"""
         success, response = self.run_test(
@@ -250,9 +414,259 @@ class AgriMarketTester:
             return True
         return False
 
-def main():
+    def test_price_series(self):
+        """Test that placed orders show up in the hourly price rollups"""
+        success, response = self.run_test(
+            "Get Price Series",
+            "GET",
+            "prices/series?category=vegetables&granularity=hour",
+            200
+        )
+        
+        if success and response.get('points'):
+            latest = response['points'][-1]
+            print(f"Latest bucket: VWAP {latest['vwap']}, volume {latest['volume']}, orders {latest['orders']}")
+            return True
+        return False
+
+    def test_notifications(self, timeout=10):
+        """Test that the farmer is notified of the order once the background job has run"""
+        headers = {'Authorization': f'Bearer {self.farmer_token}'}
+        self.tests_run += 1
+        print("\n🔍 Testing Order Notification...")
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            response = requests.get(f"{self.base_url}/notifications", headers=headers)
+            if response.status_code != 200:
+                print(f"❌ Failed - Expected 200, got {response.status_code}")
+                return False
+            if any(n['order_id'] == self.order_id for n in response.json()):
+                self.tests_passed += 1
+                print("✅ Passed - Farmer notified of the new order")
+                return True
+            time.sleep(0.5)
+
+        print(f"❌ Failed - No notification for order {self.order_id} after {timeout}s")
+        return False
+
+class EndpointStats:
+    """Latency histogram and error count for one endpoint"""
+
+    BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def record(self, latency, ok):
+        self.latencies.append(latency)
+        if not ok:
+            self.errors += 1
+
+    def percentile(self, pct):
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index] * 1000
+
+    def histogram(self):
+        counts = [0] * (len(self.BUCKETS_MS) + 1)
+        for latency in self.latencies:
+            ms = latency * 1000
+            index = next((i for i, bound in enumerate(self.BUCKETS_MS) if ms <= bound), len(self.BUCKETS_MS))
+            counts[index] += 1
+        labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return dict(zip(labels, counts))
+
+    def summary(self, elapsed):
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "requests_per_sec": round(count / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(self.errors / count, 4) if count else 0.0,
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "histogram": self.histogram(),
+        }
+
+
+class AgriMarketLoadGenerator:
+    """Drives the API with concurrent virtual users and a weighted scenario mix"""
+
+    DEFAULT_MIX = {"list_produce": 1, "browse": 6, "search": 3, "order": 2, "status_update": 1}
+    SEARCH_TERMS = ["maize", "yam", "tomato", "cassava", "mango", "rice", "pepper"]
+
+    def __init__(self, base_url, users=50, ramp_up=10.0, duration=60.0, mix=None, accounts=10):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.ramp_up = ramp_up
+        self.duration = duration
+        self.mix = mix or dict(self.DEFAULT_MIX)
+        self.accounts = accounts
+        self.stats = defaultdict(EndpointStats)
+        self.farmers = []
+        self.buyers = []
+        self.produce_ids = []
+        self.produce_owners = {}
+        self.pending_orders = []
+
+    async def request(self, client, endpoint, method, path, headers=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, f"{self.base_url}/{path}", headers=headers, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.stats[endpoint].record(time.perf_counter() - start, ok)
+        return response if ok else None
+
+    async def register(self, client, role):
+        tag = uuid.uuid4().hex[:12]
+        response = await self.request(client, "POST /auth/register", "POST", "auth/register", json={
+            "name": f"Load {role} {tag}",
+            "email": f"load-{role}-{tag}@test.com",
+            "password": "Password123!",
+            "role": role,
+            "phone": "+233200000000",
+            "region": random.choice(["accra", "ashanti", "western"])
+        })
+        if response is None:
+            raise RuntimeError(f"Could not register a {role} account for the load test")
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def setup(self, client):
+        farmer_count = max(1, self.accounts // 3)
+        self.farmers = [await self.register(client, "farmer") for _ in range(farmer_count)]
+        self.buyers = [await self.register(client, "buyer") for _ in range(max(1, self.accounts - farmer_count))]
+        for headers in self.farmers:
+            await self.list_produce(client, headers)
+
+    async def list_produce(self, client, headers=None):
+        headers = headers or random.choice(self.farmers)
+        crop = random.choice(self.SEARCH_TERMS)
+        response = await self.request(
+            client, "POST /produce", "POST", "produce", headers=headers, json={
+                "title": f"{crop.title()} {uuid.uuid4().hex[:6]}",
+                "category": random.choice(["grains", "vegetables", "fruits", "livestock"]),
+                "description": f"Fresh {crop} for the load test",
+                "price": round(random.uniform(5, 200), 2),
+                "quantity": 1_000_000,
+                "unit": "kg"
+            }
+        )
+        if response is not None:
+            produce_id = response.json()["id"]
+            self.produce_ids.append(produce_id)
+            self.produce_owners[produce_id] = headers
+
+    async def browse(self, client):
+        params = {}
+        if random.random() < 0.5:
+            params["category"] = random.choice(["grains", "vegetables", "fruits", "livestock"])
+        if random.random() < 0.3:
+            params["region"] = random.choice(["accra", "ashanti", "western"])
+        await self.request(client, "GET /produce", "GET", "produce", params=params)
+        if self.produce_ids and random.random() < 0.5:
+            produce_id = random.choice(self.produce_ids)
+            await self.request(client, "GET /produce/{id}", "GET", f"produce/{produce_id}")
+
+    async def search(self, client):
+        await self.request(
+            client, "GET /produce?search", "GET", "produce", params={"search": random.choice(self.SEARCH_TERMS)}
+        )
+
+    async def order(self, client):
+        if not self.produce_ids:
+            return await self.browse(client)
+        headers = random.choice(self.buyers)
+        produce_id = random.choice(self.produce_ids)
+        response = await self.request(client, "POST /orders", "POST", "orders", headers=headers, json={
+            "produce_id": produce_id,
+            "quantity": 1
+        })
+        if response is not None:
+            self.pending_orders.append((response.json()["id"], self.produce_owners[produce_id]))
+        if random.random() < 0.3:
+            await self.request(client, "GET /orders", "GET", "orders", headers=headers)
+
+    async def status_update(self, client):
+        if not self.pending_orders:
+            return await self.browse(client)
+        # The farmer who owns the listing confirms the order
+        order_id, farmer_headers = self.pending_orders.pop(random.randrange(len(self.pending_orders)))
+        await self.request(
+            client, "PUT /orders/{id}/status", "PUT", f"orders/{order_id}/status",
+            headers=farmer_headers, params={"status": "confirmed"}
+        )
+        await self.request(client, "GET /dashboard/stats", "GET", "dashboard/stats", headers=farmer_headers)
+
+    async def virtual_user(self, client, index, deadline):
+        if self.users > 1:
+            await asyncio.sleep(self.ramp_up * index / self.users)
+        scenarios = list(self.mix)
+        weights = [self.mix[name] for name in scenarios]
+        while time.perf_counter() < deadline:
+            scenario = random.choices(scenarios, weights)[0]
+            await getattr(self, scenario)(client)
+
+    async def run(self):
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.users, max_keepalive_connections=self.users)
+        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+            await self.setup(client)
+            self.stats.clear()
+            started = time.perf_counter()
+            deadline = started + self.ramp_up + self.duration
+            await asyncio.gather(*(self.virtual_user(client, i, deadline) for i in range(self.users)))
+            elapsed = time.perf_counter() - started
+
+        total = EndpointStats()
+        for endpoint_stats in self.stats.values():
+            total.latencies.extend(endpoint_stats.latencies)
+            total.errors += endpoint_stats.errors
+        return {
+            "users": self.users,
+            "ramp_up": self.ramp_up,
+            "duration": self.duration,
+            "mix": self.mix,
+            "elapsed": round(elapsed, 2),
+            "total": total.summary(elapsed) if total.latencies else {},
+            "endpoints": {name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())},
+        }
+
+
+def print_load_report(report):
+    print(f"\n📊 Load test: {report['users']} users, {report['ramp_up']}s ramp-up, {report['duration']}s steady")
+    print(f"{'endpoint':<26}{'req/s':>9}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, summary in rows:
+        if not summary:
+            continue
+        print(f"{name:<26}{summary['requests_per_sec']:>9}{summary['error_rate'] * 100:>8.1f}%"
+              f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}")
+    for name, summary in report["endpoints"].items():
+        buckets = " ".join(f"{label}:{count}" for label, count in summary["histogram"].items() if count)
+        print(f"  {name}: {buckets}")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in AgriMarketLoadGenerator.DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_functional_tests(base_url):
     # Setup
-    tester = AgriMarketTester()
+    tester = AgriMarketTester(base_url)
+    
+    # Test health probes
+    tester.test_health()
     
     # Test farmer registration and login
     if not tester.test_register_farmer():
@@ -274,6 +688,7 @@ def main():
     
     # Test getting produce
     tester.test_get_produce()
+    tester.test_nearby_produce()
     tester.test_get_produce_by_id()
     
     # Switch to buyer token for order creation
@@ -284,15 +699,56 @@ def main():
         print("❌ Order creation failed, stopping tests")
         return 1
     
+    # Test stock reservation under parallel buyers
+    tester.test_concurrent_orders()
+    
+    # Test that delivered orders cannot be cancelled
+    tester.test_cancel_rules()
+    
+    # Test push of order events
+    tester.test_order_events()
+    
     # Test getting orders
     tester.test_get_orders()
     
     # Test dashboard stats
     tester.test_dashboard_stats()
     
+    # Test price rollups
+    tester.test_price_series()
+    
+    # Test the new-order notification sent by the job worker
+    tester.test_notifications()
+    
     # Print results
     print(f"\n📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
     return 0 if tester.tests_passed == tester.tests_run else 1
 
+def main():
+    parser = argparse.ArgumentParser(description="Agricultural marketplace API tests and load generator")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="API base URL including /api")
+    parser.add_argument("--load", action="store_true", help="Run the concurrent load generator instead of the tests")
+    parser.add_argument("--users", type=int, default=50, help="Virtual users")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="Seconds to start all virtual users")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run after ramp-up")
+    parser.add_argument("--accounts", type=int, default=10, help="Farmer and buyer accounts shared by virtual users")
+    parser.add_argument("--mix", type=parse_mix, help="Scenario weights, e.g. browse=6,search=3,order=2")
+    parser.add_argument("--json-output", help="Write the load report to this JSON file")
+    args = parser.parse_args()
+
+    if not args.load:
+        return run_functional_tests(args.base_url)
+
+    generator = AgriMarketLoadGenerator(
+        args.base_url, users=args.users, ramp_up=args.ramp_up, duration=args.duration,
+        mix=args.mix, accounts=args.accounts
+    )
+    report = asyncio.run(generator.run())
+    print_load_report(report)
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["total"] and report["total"]["error_rate"] == 0 else 1
+
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -14,6 +14,7 @@ function App() {
   const [token, setToken] = useState(localStorage.getItem('token'));
   const [currentView, setCurrentView] = useState('home');
   const [produce, setProduce] = useState([]);
+  const [produceCursor, setProduceCursor] = useState(null);
   const [orders, setOrders] = useState([]);
   const [stats, setStats] = useState({});
   const [loading, setLoading] = useState(false);
@@ -271,18 +272,22 @@ function App() {
       price: '',
       quantity: '',
       unit: 'kg',
-      image_data: ''
+      image_id: null
     });
 
-    const handleImageUpload = (e) => {
+    const handleImageUpload = async (e) => {
       const file = e.target.files[0];
       if (file) {
-        const reader = new FileReader();
-        reader.onload = (e) => {
-          const base64 = e.target.result.split(',')[1];
-          setFormData({...formData, image_data: base64});
-        };
-        reader.readAsDataURL(file);
+        const upload = new FormData();
+        upload.append('file', file);
+        try {
+          const response = await axios.post('/images', upload, {
+            headers: { 'Content-Type': 'multipart/form-data' }
+          });
+          setFormData({...formData, image_id: response.data.image_id});
+        } catch (error) {
+          setError(error.response?.data?.detail || 'Failed to upload image');
+        }
       }
     };
 
@@ -435,6 +440,66 @@ function App() {
       fetchDashboardData();
     }, []);
 
+    // Order changes are pushed over SSE instead of polling /orders and /dashboard/stats.
+    // The stream token in the URL expires after a minute, so every connect fetches a new one.
+    useEffect(() => {
+      if (!token || !['farmer', 'buyer'].includes(user?.role)) return undefined;
+      let events = null;
+      let retryTimer = null;
+      let closed = false;
+
+      const connect = async () => {
+        try {
+          const response = await axios.post('/orders/events/token');
+          if (closed) return;
+          events = new EventSource(
+            `${API}/orders/events?stream_token=${encodeURIComponent(response.data.stream_token)}`
+          );
+          events.onmessage = handleEvent;
+          events.onerror = () => {
+            // Reconnect with a new token, then refetch whatever changed while disconnected
+            events.close();
+            retryTimer = setTimeout(() => {
+              connect();
+              fetchDashboardData();
+            }, 5000);
+          };
+        } catch (error) {
+          console.error('Error opening order events:', error);
+          if (!closed) retryTimer = setTimeout(connect, 5000);
+        }
+      };
+
+      const handleEvent = (message) => {
+        const event = JSON.parse(message.data);
+        if (event.type === 'resync' || !event.stats) {
+          fetchDashboardData();
+          return;
+        }
+        if (event.type === 'order.created') {
+          setOrders((current) => [event.order, ...current.filter((order) => order.id !== event.order.id)]);
+        } else if (event.type === 'order.updated') {
+          setOrders((current) => current.map((order) => (
+            order.id === event.order.id ? { ...order, ...event.order } : order
+          )));
+        }
+        setStats((current) => {
+          const next = { ...current };
+          Object.entries(event.stats).forEach(([field, delta]) => {
+            if (field in next) next[field] += delta;
+          });
+          return next;
+        });
+      };
+
+      connect();
+      return () => {
+        closed = true;
+        clearTimeout(retryTimer);
+        if (events) events.close();
+      };
+    }, [token, user?.role]);
+
     const fetchDashboardData = async () => {
       try {
         const [statsResponse, ordersResponse] = await Promise.all([
@@ -447,13 +512,24 @@ function App() {
         
         if (user?.role === 'farmer') {
           const produceResponse = await axios.get(`/produce/farmer/${user.id}`);
-          setProduce(produceResponse.data);
+          setProduce(produceResponse.data.items);
+          setProduceCursor(produceResponse.data.next_cursor);
         }
       } catch (error) {
         console.error('Error fetching dashboard data:', error);
       }
     };
 
+    const loadMoreFarmerProduce = async () => {
+      try {
+        const response = await axios.get(`/produce/farmer/${user.id}`, { params: { after: produceCursor } });
+        setProduce((current) => [...current, ...response.data.items]);
+        setProduceCursor(response.data.next_cursor);
+      } catch (error) {
+        console.error('Error fetching produce:', error);
+      }
+    };
+
     return (
       <div className="max-w-6xl mx-auto p-6">
         <div className="bg-white rounded-lg shadow-md p-6 mb-6">
@@ -536,7 +612,7 @@ function App() {
             <div className="bg-white rounded-lg shadow-md p-6">
               <h3 className="text-xl font-bold mb-4 text-green-800">My Produce</h3>
               <div className="space-y-3">
-                {produce.slice(0, 5).map((item) => (
+                {produce.map((item) => (
                   <div key={item.id} className="border-l-4 border-blue-500 pl-4 py-2">
                     <h4 className="font-semibold">{item.title}</h4>
                     <p className="text-sm text-gray-600">
@@ -553,6 +629,14 @@ function App() {
                   </div>
                 ))}
               </div>
+              {produceCursor && (
+                <button
+                  onClick={loadMoreFarmerProduce}
+                  className="mt-4 text-green-700 hover:underline"
+                >
+                  Load more
+                </button>
+              )}
             </div>
           )}
         </div>
@@ -561,51 +645,91 @@ function App() {
   };
 
   const MarketPlace = () => {
-    const [allProduce, setAllProduce] = useState([]);
-    const [filteredProduce, setFilteredProduce] = useState([]);
+    const [produceList, setProduceList] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [filters, setFilters] = useState({
       category: '',
       region: '',
       search: ''
     });
+    const [facets, setFacets] = useState(null);
+    const [nearMe, setNearMe] = useState(null);
+
+    // Filtering and search happen on the server, which pages results with next_cursor
+    const produceParams = () => {
+      const params = {};
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value) params[key] = value;
+      });
+      if (nearMe) {
+        // The API does not combine a text search with distance ordering
+        delete params.search;
+        params.lat = nearMe.latitude;
+        params.lon = nearMe.longitude;
+      }
+      return params;
+    };
 
     useEffect(() => {
-      fetchProduce();
-    }, []);
+      let cancelled = false;
+      // Wait for typing to pause before searching, and drop responses for stale filters
+      const timer = setTimeout(async () => {
+        try {
+          const response = await axios.get('/produce', { params: produceParams() });
+          if (!cancelled) {
+            setProduceList(response.data.items);
+            setNextCursor(response.data.next_cursor);
+          }
+        } catch (error) {
+          console.error('Error fetching produce:', error);
+        }
+      }, 300);
+      return () => {
+        cancelled = true;
+        clearTimeout(timer);
+      };
+    }, [filters, nearMe]);
 
     useEffect(() => {
-      filterProduce();
-    }, [allProduce, filters]);
+      const params = {};
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value) params[key] = value;
+      });
+      axios.get('/produce/facets', { params })
+        .then((response) => setFacets(response.data))
+        .catch((error) => console.error('Error fetching facets:', error));
+    }, [filters]);
+
+    const withCount = (label, group, value) => (
+      facets ? `${label} (${facets[group][value] ?? 0})` : label
+    );
 
-    const fetchProduce = async () => {
+    const loadMoreProduce = async () => {
       try {
-        const response = await axios.get('/produce');
-        setAllProduce(response.data);
-        setFilteredProduce(response.data);
+        const response = await axios.get('/produce', { params: { ...produceParams(), after: nextCursor } });
+        setProduceList((current) => [...current, ...response.data.items]);
+        setNextCursor(response.data.next_cursor);
       } catch (error) {
         console.error('Error fetching produce:', error);
       }
     };
 
-    const filterProduce = () => {
-      let filtered = allProduce;
-
-      if (filters.category) {
-        filtered = filtered.filter(item => item.category === filters.category);
-      }
-
-      if (filters.region) {
-        filtered = filtered.filter(item => item.region === filters.region);
+    const toggleNearMe = () => {
+      if (nearMe) {
+        setNearMe(null);
+        return;
       }
-
-      if (filters.search) {
-        filtered = filtered.filter(item => 
-          item.title.toLowerCase().includes(filters.search.toLowerCase()) ||
-          item.description.toLowerCase().includes(filters.search.toLowerCase())
-        );
+      if (!navigator.geolocation) {
+        alert('Location is not available in this browser');
+        return;
       }
-
-      setFilteredProduce(filtered);
+      navigator.geolocation.getCurrentPosition(
+        (position) => setNearMe({
+          latitude: position.coords.latitude,
+          longitude: position.coords.longitude
+        }),
+        () => alert('Could not get your location')
+      );
     };
 
     const handleOrder = async (produceId, quantity = 1) => {
@@ -645,8 +769,9 @@ function App() {
                 type="text"
                 value={filters.search}
                 onChange={(e) => setFilters({...filters, search: e.target.value})}
+                disabled={!!nearMe}
                 className="w-full px-3 py-2 border rounded-lg focus:outline-none focus:border-green-500"
-                placeholder="Search produce..."
+                placeholder={nearMe ? 'Turn off Near me to search' : 'Search produce...'}
               />
             </div>
             <div>
@@ -659,10 +784,10 @@ function App() {
                 className="w-full px-3 py-2 border rounded-lg focus:outline-none focus:border-green-500"
               >
                 <option value="">All Categories</option>
-                <option value="grains">Grains</option>
-                <option value="vegetables">Vegetables</option>
-                <option value="fruits">Fruits</option>
-                <option value="livestock">Livestock</option>
+                <option value="grains">{withCount('Grains', 'categories', 'grains')}</option>
+                <option value="vegetables">{withCount('Vegetables', 'categories', 'vegetables')}</option>
+                <option value="fruits">{withCount('Fruits', 'categories', 'fruits')}</option>
+                <option value="livestock">{withCount('Livestock', 'categories', 'livestock')}</option>
               </select>
             </div>
             <div>
@@ -675,21 +800,27 @@ function App() {
                 className="w-full px-3 py-2 border rounded-lg focus:outline-none focus:border-green-500"
               >
                 <option value="">All Regions</option>
-                <option value="accra">Accra</option>
-                <option value="ashanti">Ashanti</option>
-                <option value="western">Western</option>
+                <option value="accra">{withCount('Accra', 'regions', 'accra')}</option>
+                <option value="ashanti">{withCount('Ashanti', 'regions', 'ashanti')}</option>
+                <option value="western">{withCount('Western', 'regions', 'western')}</option>
               </select>
             </div>
           </div>
+          <button
+            onClick={toggleNearMe}
+            className={`mt-4 py-2 px-4 rounded-lg ${nearMe ? 'bg-green-600 text-white hover:bg-green-700' : 'bg-gray-200 text-gray-700 hover:bg-gray-300'}`}
+          >
+            {nearMe ? 'Showing produce near me' : 'Near me'}
+          </button>
         </div>
 
         {/* Produce Grid */}
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-          {filteredProduce.map((item) => (
+          {produceList.map((item) => (
             <div key={item.id} className="bg-white rounded-lg shadow-md overflow-hidden">
-              {item.image_data && (
+              {item.image_id && (
                 <img
-                  src={`data:image/jpeg;base64,${item.image_data}`}
+                  src={`${API}/images/${item.image_id}/thumbnail`}
                   alt={item.title}
                   className="w-full h-48 object-cover"
                 />
@@ -715,6 +846,7 @@ function App() {
                 </div>
                 <p className="text-sm text-gray-500 mb-3">
                   Farmer: {item.farmer_name}
+                  {item.distance_km !== undefined && ` • ${item.distance_km} km away`}
                 </p>
                 {user && user.role === 'buyer' && (
                   <button
@@ -736,6 +868,16 @@ function App() {
             </div>
           ))}
         </div>
+        {nextCursor && (
+          <div className="text-center mt-6">
+            <button
+              onClick={loadMoreProduce}
+              className="bg-gray-200 text-gray-700 py-2 px-6 rounded-lg hover:bg-gray-300"
+            >
+              Load more
+            </button>
+          </div>
+        )}
       </div>
     );
   };